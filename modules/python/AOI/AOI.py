@@ -34,3 +34,29 @@ class AOI:
         aois[aoi_num] = Rectangle(-np.inf, np.inf, -np.inf, np.inf)
 
         self.aois = aois.copy()
+
+    def get_aoi_numbers(self, x, y, include_border=False):
+        """
+        Находит номера областей регулярной сетки для массивов координат без перебора прямоугольников.
+        Номера совпадают с ключами get_aoi_list: ячейки нумеруются с 1 построчно,
+        точки вне сетки (и на границах ячеек при include_border=False) получают номер
+        охватывающей области cells_x * cells_y + 1, пропущенные точки - номер 0
+
+        Inputs:
+            x, y - массивы координат в единицах x_coef и y_coef
+            include_border - флаг, правая и нижняя границы принадлежат ячейке, как в Rectangle.includes
+        """
+        x, y = np.asarray(x, float), np.asarray(y, float)
+        xs = np.linspace(0, self.x_coef, self.cells_x + 1)
+        ys = np.linspace(0, self.y_coef, self.cells_y + 1)
+
+        # Номер столбца i для xs[i] < x <= xs[i + 1], аналогично для строк
+        col = np.digitize(x, xs, right=True) - 1
+        row = np.digitize(y, ys, right=True) - 1
+        inside = (col >= 0) & (col < self.cells_x) & (row >= 0) & (row < self.cells_y)
+        if not include_border:
+            inside &= (x != xs[np.clip(col + 1, 0, self.cells_x)]) & (y != ys[np.clip(row + 1, 0, self.cells_y)])
+
+        aois = np.where(inside, row * self.cells_x + col + 1, self.cells_x * self.cells_y + 1)
+        aois[np.isnan(x) | np.isnan(y)] = 0
+        return aois
@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+from AOI.Rectangle import Rectangle
+from AOI.Polygon import Polygon
+
+
+class Layout:
+
+    def __init__(self, buckets=(32, 32)):
+        """
+        Создаёт пустой набор областей интереса произвольной формы (прямоугольники и многоугольники)
+        с пространственным индексом для пакетного поиска областей точек
+
+        Inputs:
+            buckets - число ячеек индекса по x и y
+        """
+        self.buckets = buckets
+        self.regions = []
+        self.names = []
+        self.priorities = []
+        self.index = None
+
+    def __len__(self):
+        return len(self.regions)
+
+    def add(self, region, name=None, priority=0):
+        """
+        Добавляет область. Точка в пересечении областей относится к области с наибольшим приоритетом,
+        а при равных приоритетах - к добавленной раньше
+
+        Inputs:
+            region - Rectangle, Polygon или другой объект с полями x0, x1, y0, y1 и методом includes
+            name - название области, по умолчанию её номер
+            priority - приоритет области
+        """
+        self.regions.append(region)
+        self.names.append(len(self.regions) if name is None else name)
+        self.priorities.append(priority)
+        self.index = None
+        return self
+
+    @staticmethod
+    def from_records(records, buckets=(32, 32)):
+        """
+        Создаёт набор областей из списка словарей вида
+        {'name': ..., 'rect': [x0, x1, y0, y1], 'priority': ...} или {'name': ..., 'polygon': [[x, y], ...]}
+        """
+        layout = Layout(buckets)
+        for record in records:
+            if 'rect' in record:
+                region = Rectangle(*record['rect'])
+            elif 'polygon' in record:
+                region = Polygon(record['polygon'])
+            else:
+                raise ValueError('Region must have \'rect\' or \'polygon\' field.')
+            layout.add(region, record.get('name'), record.get('priority', 0))
+        return layout
+
+    @staticmethod
+    def from_json(path, buckets=(32, 32)):
+        """
+        Загружает набор областей из json-файла со списком словарей формата from_records
+        """
+        with open(path) as f:
+            return Layout.from_records(json.load(f), buckets)
+
+    def build_index(self):
+        """
+        Строит равномерную сетку корзин над описывающим прямоугольником всех областей.
+        Каждая корзина хранит номера пересекающих её областей в порядке приоритета
+        """
+        n = len(self.regions)
+        boxes = np.array([[r.x0, r.x1, r.y0, r.y1] for r in self.regions], float).reshape(n, 4)
+        nx, ny = self.buckets
+        x_edges = np.linspace(boxes[:, 0].min(initial=0), boxes[:, 1].max(initial=1), nx + 1)
+        y_edges = np.linspace(boxes[:, 2].min(initial=0), boxes[:, 3].max(initial=1), ny + 1)
+
+        # Порядок проверки: по убыванию приоритета, затем по порядку добавления
+        order = np.lexsort((np.arange(n), -np.asarray(self.priorities, float)))
+        bucket_regions = [[] for _ in range(nx * ny)]
+        for k in order:
+            x0, x1, y0, y1 = boxes[k]
+            c0, c1 = self._bucket(x_edges, x0, nx), self._bucket(x_edges, x1, nx)
+            r0, r1 = self._bucket(y_edges, y0, ny), self._bucket(y_edges, y1, ny)
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    bucket_regions[row * nx + col].append(k)
+
+        counts = np.array([len(x) for x in bucket_regions])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        flat = np.array([k for x in bucket_regions for k in x], int)
+        self.index = (x_edges, y_edges, starts, counts, flat)
+
+    @staticmethod
+    def _bucket(edges, values, n):
+        return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, n - 1)
+
+    def locate(self, x, y, include_border=False):
+        """
+        Находит номера областей для массивов координат. Области нумеруются с 1 в порядке добавления,
+        точки вне всех областей получают номер len(layout) + 1, пропущенные точки - номер 0,
+        как в AOI.get_aoi_numbers
+
+        Inputs:
+            x, y - массивы координат в тех же единицах, что и области
+            include_border - флаг, граница принадлежит области
+        """
+        if self.index is None:
+            self.build_index()
+        x_edges, y_edges, starts, counts, flat = self.index
+        nx, ny = self.buckets
+        x, y = np.asarray(x, float), np.asarray(y, float)
+        shape = np.broadcast(x, y).shape
+        x, y = np.broadcast_to(x, shape).ravel(), np.broadcast_to(y, shape).ravel()
+
+        aois = np.full(len(x), len(self.regions) + 1)
+        missing = np.isnan(x) | np.isnan(y)
+        aois[missing] = 0
+
+        inside = ~missing & (x >= x_edges[0]) & (x <= x_edges[-1]) & (y >= y_edges[0]) & (y <= y_edges[-1])
+        points = np.flatnonzero(inside)
+        buckets = self._bucket(y_edges, y[points], ny) * nx + self._bucket(x_edges, x[points], nx)
+
+        # k-я по приоритету область корзины проверяется для всех ещё не найденных точек сразу
+        k = 0
+        while len(points):
+            has_candidate = counts[buckets] > k
+            points, buckets = points[has_candidate], buckets[has_candidate]
+            candidates = flat[starts[buckets] + k]
+            found = np.zeros(len(points), bool)
+            for region in np.unique(candidates):
+                mask = candidates == region
+                found[mask] = self.regions[region].includes(x[points[mask]], y[points[mask]], include_border)
+            aois[points[found]] = candidates[found] + 1
+            points, buckets = points[~found], buckets[~found]
+            k += 1
+        return aois.reshape(shape)
@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class Polygon:
+    def __init__(self, points):
+        """
+        Создаёт многоугольник с вершинами в заданных точках
+
+        Inputs:
+            points - последовательность вершин [[x, y], ...] в порядке обхода, не менее трёх
+        """
+        points = np.asarray(points, float)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError('Polygon must have at least three [x, y] points.')
+
+        self.points = points
+        # Описывающий прямоугольник, в тех же полях, что у Rectangle
+        self.x0, self.y0 = points.min(0)
+        self.x1, self.y1 = points.max(0)
+
+    def includes(self, x, y, include_border=False):
+        """
+        Проверяет попадание точек в многоугольник по правилу чётности пересечений луча.
+        Принимает как отдельные точки, так и массивы координат
+
+        Inputs:
+            x, y - координаты точек
+            include_border - флаг, точки на границе описывающего прямоугольника не отсекаются заранее
+        """
+        x, y = np.asarray(x, float), np.asarray(y, float)
+        if include_border:
+            inside_box = (x >= self.x0) & (x <= self.x1) & (y >= self.y0) & (y <= self.y1)
+        else:
+            inside_box = (x > self.x0) & (x < self.x1) & (y > self.y0) & (y < self.y1)
+
+        inside = np.zeros(np.broadcast(x, y).shape, bool)
+        xa, ya = self.points[:, 0], self.points[:, 1]
+        xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+        for x0, y0, x1, y1 in zip(xa, ya, xb, yb):
+            crosses = (y0 > y) != (y1 > y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (x < x_cross)
+        return inside & inside_box
@@ -39,12 +39,13 @@ def get_transition_matrix(path, settings=None):
     ts_in_group = settings['ts_in_group']
     cells_x, cells_y = settings['cells_xy']
     empty_aoi = settings['empty_aoi']
+    layout = settings.get('layout')
 
     # Считывание и предобработка траектории
     tr = Trajectory(path, t_col, x_col, y_col)
     tr.set_parameters(x_coef=x_coef, y_coef=y_coef, t_coef=t_coef,
                       min_time=min_time, ts_in_group=ts_in_group,
-                      cells_x=cells_x, cells_y=cells_y)
+                      cells_x=cells_x, cells_y=cells_y, layout=layout)
     tr.prepare_time()
     tr.group_by_time()
     tr.prepare_coordinates()
@@ -54,11 +55,21 @@ def get_transition_matrix(path, settings=None):
     return tr.transition_matrix
 
 
-def get_classes_probabilities(class_pathes, settings=None, main_path=None, nb = True):
+def get_classes_probabilities(class_pathes, settings=None, main_path=None, nb = True, progress=None):
     """
     Для каждого класса по заданным файлам строится матрица вероятностей переходов
+
+    Inputs:
+        nb - флаг, отображать прогресс виджетом tqdm_notebook, иначе текстовым tqdm
+        progress - обёртка итератора файлов, как tqdm (например, eyevents.profiler.progress_callback),
+                   False для отключения, None для выбора по флагу nb
     """
-    iter_ = tqdm_notebook if nb else tqdm
+    if progress is None:
+        iter_ = tqdm_notebook if nb else tqdm
+    elif progress is False:
+        iter_ = lambda x, total=None: x
+    else:
+        iter_ = progress
 
     class_matrixes = dict([x, None] for x in class_pathes.keys())
 
@@ -68,7 +79,7 @@ def get_classes_probabilities(class_pathes, settings=None, main_path=None, nb =
 
     for _class in _classes:
         class_seq = []
-        for x in iter_(class_pathes[_class]):
+        for x in iter_(class_pathes[_class], total=len(class_pathes[_class])):
             class_seq.append(get_transition_matrix(prefix + x, settings))
         class_matrixes[_class] = class_seq
         print('Class \'{}\' was evaluated'.format(_class))
@@ -102,12 +113,13 @@ def get_likelyhood_estimation(new_path, classes_probabilities, settings=None):
     ts_in_group = settings['ts_in_group']
     cells_x, cells_y = settings['cells_xy']
     empty_aoi = settings['empty_aoi']
+    layout = settings.get('layout')
 
     # Считывание новой траектории
     tr = Trajectory(new_path, t_col, x_col, y_col)
     tr.set_parameters(x_coef=x_coef, y_coef=y_coef, t_coef=t_coef,
                       min_time=min_time, ts_in_group=ts_in_group,
-                      cells_x=cells_x, cells_y=cells_y)
+                      cells_x=cells_x, cells_y=cells_y, layout=layout)
     tr.prepare_time()
     tr.group_by_time()
     tr.prepare_coordinates()
@@ -31,6 +31,6 @@ class Rectangle:
                 return (val > min_) & (val < max_)
 
         x_is_in = between(x, self.x0, self.x1, include_border)
-        y_is_in = between(x, self.y0, self.y1, include_border)
+        y_is_in = between(y, self.y0, self.y1, include_border)
 
         return x_is_in & y_is_in
\ No newline at end of file
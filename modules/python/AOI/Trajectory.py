@@ -5,13 +5,14 @@ from AOI.AOI import AOI
 
 class Trajectory(AOI):
 
-    def __init__(self, file, t_col=0, x_col=1, y_col=2, **kwargs):
+    def __init__(self, file, t_col=0, x_col=1, y_col=2, cache=None, **kwargs):
         """
         Загружает траекторию из указанного файла
 
         Inputs:
             file - путь к файлу csv или txt
             t_col, x_col, y_col - номера столбцов с отметкой времени и координатами
+            cache - кэш разобранных файлов (eyevents.cache.RecordingCache), None для чтения csv при каждой загрузке
             **kwargs - дополнительные настройки загрузчика: разделитель, десятичная точка и пр.
         """
         self.grouped_data = None
@@ -22,20 +23,29 @@ class Trajectory(AOI):
         self.ts_in_group = None
         self.cells_x = None
         self.cells_y = None
+        self.layout = None
         self.aoi_df = None
 
-        df = pd.read_csv(file, **kwargs)
-        cols = []
-        for col_number in [t_col, x_col, y_col]:
-            cols.append(df.columns[col_number])
-        df = df[cols].copy()
-        df.columns = ['t', 'x', 'y']
-        self.raw_data = df.copy()
+        if cache is None:
+            df = pd.read_csv(file, **kwargs)
+            cols = []
+            for col_number in [t_col, x_col, y_col]:
+                cols.append(df.columns[col_number])
+            df = df[cols].copy()
+            df.columns = ['t', 'x', 'y']
+        else:
+            df = cache.read(file, kwargs, dict(t=t_col, x=x_col, y=y_col))
+        # Исходные столбцы не изменяются, set_parameters копирует их в self.data,
+        # поэтому перенастройка не требует повторного чтения файла
+        self.raw_data = df
 
     def set_parameters(self, x_coef=1280, y_coef=720, t_coef=.001, min_time=True,
-                       ts_in_group=1, cells_x=5, cells_y=5):
+                       ts_in_group=1, cells_x=5, cells_y=5, layout=None):
         """
 
+        Inputs:
+            layout - набор областей интереса произвольной формы (AOI.Layout.Layout) в единицах x_coef и y_coef,
+                     используется вместо регулярной сетки cells_x * cells_y, если задан
         """
         self.x_coef = x_coef
         self.y_coef = y_coef
@@ -44,15 +54,21 @@ class Trajectory(AOI):
         self.ts_in_group = ts_in_group
         self.cells_x = cells_x
         self.cells_y = cells_y
-        self.data = self.raw_data.copy()
+        self.layout = layout
+        self.data = pd.DataFrame({x: np.array(self.raw_data[x].values) for x in ['t', 'x', 'y']})
+        # Результаты, посчитанные по прежним параметрам, пересчитываются заново
+        self.grouped_data = None
+        self.aoi_df = None
 
     def prepare_time(self):
         """
         Переводит отметки времени к нулю (опционально) и в нужные единицы измерения
         """
+        t = self.data['t'].values
         if self.min_time:
-            self.data['t'] -= min(self.data['t'])
-        self.data['t'] = self.data['t'] * self.t_coef
+            t = t - np.nanmin(t)
+        self.data['t'] = t * self.t_coef
+        self.aoi_df = None
 
     def prepare_coordinates(self):
         """
@@ -60,56 +76,58 @@ class Trajectory(AOI):
         """
         self.data['x'] *= self.x_coef
         self.data['y'] *= self.y_coef
+        self.aoi_df = None
 
-    def group_by_time(self):
+    def group_by_time(self, ts_in_group=None):
         """
+        Разбивает траекторию на интервалы времени длиной ts_in_group и оставляет последнюю точку каждого интервала.
+        Номер интервала - целая часть t / ts_in_group
 
+        Inputs:
+            ts_in_group - длина интервала, None для значения из set_parameters. Заданное значение сохраняется,
+                          так что подбор длины интервала не требует повторной загрузки и подготовки данных
         """
-        df = self.data.copy()
-        df['t'] = [int(x) for x in df['t'] / self.ts_in_group]
-        self.grouped_data = df.groupby('t').agg('tail', 1).reset_index().drop('index', 1)
+        if ts_in_group is not None:
+            self.ts_in_group = ts_in_group
+        groups = (self.data['t'].values / self.ts_in_group).astype(np.int64)
+        # np.unique находит первое вхождение, поэтому ищем его в развёрнутом массиве
+        t, first = np.unique(groups[::-1], return_index=True)
+        last = len(groups) - 1 - first
+        # Интервалы идут в порядке своих последних точек в записи, как при groupby(...).tail(1)
+        order = np.argsort(last)
+        t, last = t[order], last[order]
+        self.grouped_data = pd.DataFrame({'t': t, 'x': self.data['x'].values[last], 'y': self.data['y'].values[last]})
 
     def trajectory_to_aois(self):
         """
-
+        Находит номера областей для всех точек траектории, см. AOI.get_aoi_numbers и Layout.locate
         """
-        self.get_aoi_list()
-        aois = self.aois
-        t_s, aoi_num = [], []
-        for row in self.data.iterrows():
-            t, x, y = row[1]
-            t_s.append(t)
-            no_aoi = True
-            for aoi in aois.keys():
-                if aois[aoi].includes(x, y):
-                    aoi_num.append(aoi)
-                    no_aoi = False
-                    break
-            if no_aoi:
-                aoi_num.append(0)
-        df = pd.DataFrame({'t': t_s, 'aoi': aoi_num})
-        self.aoi_df = df.copy()
+        if self.layout is None:
+            aoi_num = self.get_aoi_numbers(self.data['x'].values, self.data['y'].values)
+        else:
+            aoi_num = self.layout.locate(self.data['x'].values, self.data['y'].values)
+        self.aoi_df = pd.DataFrame({'t': self.data['t'].values, 'aoi': aoi_num})
 
     def get_transition_matrix(self, empty_aoi=True, to_probabilities=True):
         """
-
+        Считает матрицу переходов между областями: элемент [to][from] - число переходов из from в to.
+        Охватывающая область и пропущенные точки учитываются последней строкой и столбцом при empty_aoi=True
+        и исключаются из последовательности иначе
         """
         if self.aoi_df is None:
             self.trajectory_to_aois()
 
-        cells = self.cells_x * self.cells_y
+        cells = self.cells_x * self.cells_y if self.layout is None else len(self.layout)
         n_aois = cells + int(empty_aoi)
 
-        aoi_df = self.aoi_df.copy()
-        if not empty_aoi:
-            aoi_df = aoi_df[aoi_df['aoi'] < cells].copy()
-
-        aoi_seq = aoi_df['aoi'].values - 1
-
-        transition_matrix = np.zeros((n_aois, n_aois))
+        aoi_seq = self.aoi_df['aoi'].values
+        if empty_aoi:
+            aoi_seq = np.where(aoi_seq == 0, cells + 1, aoi_seq) - 1
+        else:
+            aoi_seq = aoi_seq[(aoi_seq > 0) & (aoi_seq <= cells)] - 1
 
-        for from_, to_ in zip(aoi_seq[:-1], aoi_seq[1:]):
-            transition_matrix[to_][from_] += 1
+        codes = aoi_seq[1:] * n_aois + aoi_seq[:-1]
+        transition_matrix = np.bincount(codes, minlength=n_aois * n_aois).reshape(n_aois, n_aois).astype(float)
 
         if to_probabilities:
             colsums = sum(transition_matrix)
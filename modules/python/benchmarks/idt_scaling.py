@@ -0,0 +1,39 @@
+"""Shows that Detector.idt time grows linearly with the recording length.
+
+Run from modules/python directory: python -m benchmarks.idt_scaling
+"""
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+
+from eyevents.detector import Detector
+
+
+def gaze_angles(n, rate=500, seed=0):
+    """Returns time and angular coordinates of fixations with noise joined by instant saccades"""
+    rng = np.random.RandomState(seed)
+    fixation_lengths = rng.randint(rate // 10, rate, size=n // (rate // 10) + 1)
+    centers = rng.uniform(-15, 15, size=(len(fixation_lengths), 2))
+    centers = np.repeat(centers, fixation_lengths, axis=0)[:n]
+    angles = centers + rng.normal(scale=.2, size=(n, 2))
+    return np.arange(n) / rate, angles[:, 0], angles[:, 1]
+
+
+def main(lengths=(25000, 50000, 100000, 200000, 400000), repeats=3):
+    rows = []
+    for n in lengths:
+        time, x, y = gaze_angles(n)
+        best = np.inf
+        for _ in range(repeats):
+            start = default_timer()
+            Detector.idt_codes(time, x, y, dispersion_threshold=1.5, duration_threshold=.1)
+            best = min(best, default_timer() - start)
+        rows.append(dict(samples=n, seconds=best, us_per_sample=best / n * 1e6))
+    result = pd.DataFrame(rows)
+    print(result.to_string(index=False))
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Times and memory-profiles hot paths on synthetic recordings.
+
+Every case is run 'repeats' times to take the best time and once more under tracemalloc to take the peak of
+allocated memory. Results are saved to <output>.json with the run parameters and library versions
+and to <output>.csv, so runs of different versions can be compared.
+
+Run from modules/python directory:
+python -m benchmarks.suite --files 10 --duration 60 --rate 500 --output results
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+
+from AOI import PreparedTrajectory
+from benchmarks.synthetic import write_recordings
+from eyevents.detector import Detector
+from eyevents.heatmaps import Heatmap
+from eyevents.settings import settings as settings_template
+from eyevents.summariser import Summariser
+from eyevents.trajectories import Trajectories
+from eyevents.trajectory import Trajectory
+
+
+def benchmark_settings():
+    """Returns eyevents settings for synthetic recordings"""
+    settings = copy.deepcopy(settings_template)
+    settings['columns'] = dict(time=0, porx=1, pory=2)
+    return settings
+
+
+def aoi_settings():
+    """Returns AOI package settings for synthetic recordings, grouping samples by 0.1 s"""
+    return {
+        'txy_columns': [0, 1, 2],
+        'txy_coefs': [1, 1920, 1080],
+        'min_time': True,
+        'ts_in_group': .1,
+        'cells_xy': [5, 5],
+        'empty_aoi': True
+    }
+
+
+def measure(func, setup=None, repeats=3):
+    """Returns the best time of func calls and peak memory allocated by one call
+
+    :param func: function getting setup result
+    :param setup: function preparing func argument, not timed, None for no argument
+    :param repeats: number of timed calls
+    :return: best time in seconds and peak memory in bytes
+    :rtype: (float, int)
+    """
+    best = np.inf
+    for _ in range(repeats):
+        arg = setup() if setup is not None else None
+        start = default_timer()
+        func(arg)
+        best = min(best, default_timer() - start)
+    arg = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        func(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def stage_setup(path, settings, name):
+    """Returns setup building lazy trajectory with the stages upstream of the named stage calculated"""
+    def setup():
+        trajectory = Trajectory(path, settings, lazy=True)
+        for upstream in Trajectory.STAGES[name]['upstream']:
+            trajectory.get_stage(upstream)
+        return trajectory
+    return setup
+
+
+def cases(directory, paths, settings):
+    """Yields case names, functions and setups"""
+    path = paths[0]
+    for name in Trajectory.STAGES:
+        yield 'Trajectory.' + name, (lambda x, name=name: x.get_stage(name)), stage_setup(path, settings, name)
+
+    df = Trajectory(path, settings).df
+    detected = Detector.ivt(df, settings)
+    fixations = detected[detected['event'] == 'Fixation']
+    yield 'Detector.ivt', lambda x: Detector.ivt(df, settings), None
+    thresholds = np.linspace(10, 200, 20)
+    yield 'Detector.ivt_sweep', lambda x: Detector.ivt_sweep(df, thresholds), None
+    yield 'Summariser.total_saccade_params', lambda x: Summariser.total_saccade_params(detected, 'code'), None
+    yield 'Summariser.total_fixation_params', lambda x: Summariser.total_fixation_params(detected, 'code'), None
+    yield 'Summariser.area', lambda x: fixations.groupby('group').apply(Summariser.area), None
+
+    trajectories = [Trajectory(x, settings) for x in paths]
+    counts, probabilities, log_probabilities = Trajectories.stack_transitions(trajectories)
+    yield 'Trajectories.stack_transitions', lambda x: Trajectories.stack_transitions(trajectories), None
+    yield 'Trajectories.get_likelihoods', lambda x: Trajectories.get_likelihoods(counts, probabilities), None
+    yield 'Trajectories.get_log_likelihoods', lambda x: Trajectories.get_log_likelihoods(counts,
+                                                                                        log_probabilities), None
+    yield 'Trajectories', lambda x: Trajectories(directory, settings, progress=False), None
+    all_fixations = pd.concat([Summariser.fixation_params(x.events, x.name) for x in trajectories], ignore_index=True)
+    yield 'Heatmap.group_heatmaps', lambda x: Heatmap.group_heatmaps(all_fixations, settings, bin_size=4), None
+
+    names = [os.path.basename(x) for x in paths]
+    classes = {'first': names[:len(names) // 2 or 1], 'second': names[len(names) // 2:] or names}
+    prefix = os.path.join(directory, '')
+
+    def classes_probabilities(x):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            PreparedTrajectory.get_classes_probabilities(classes, aoi_settings(), prefix, nb=False)
+    yield 'AOI.PreparedTrajectory.get_classes_probabilities', classes_probabilities, None
+
+
+def run(directory=None, files=10, duration=60, rate=500, repeats=3, seed=0, only=None):
+    """Runs benchmark cases on synthetic recordings
+
+    :param directory: path to write synthetic recordings to, None for temporary directory
+    :param files: number of recordings
+    :param duration: recording length in seconds
+    :param rate: sampling rate in Hz
+    :param repeats: number of timed calls of every case
+    :param seed: seed of the first recording
+    :param only: substrings of case names to run, None for all cases
+    :return: case names, best times, throughputs and memory peaks
+    :rtype: pandas.DataFrame
+    """
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        paths = write_recordings(directory, files, duration, rate, seed)
+        samples = int(duration * rate)
+        rows = []
+        for name, func, setup in cases(directory, paths, benchmark_settings()):
+            if only and not any(x in name for x in only):
+                continue
+            seconds, peak = measure(func, setup, repeats)
+            n = samples * files if name.startswith(('Trajectories', 'AOI')) else samples
+            rows.append(dict(case=name, seconds=seconds, samples=n, samples_per_second=n / seconds,
+                             peak_bytes=peak))
+            print('{:<52}{:>10.4f} s{:>12.1f} MB'.format(name, seconds, peak / 2 ** 20), file=sys.stderr)
+    return pd.DataFrame(rows)
+
+
+def save(result, output, parameters):
+    """Saves results to <output>.csv and <output>.json with run parameters and environment"""
+    result.to_csv(output + '.csv', index=False)
+    meta = dict(parameters=parameters, python=platform.python_version(), platform=platform.platform(),
+                numpy=np.__version__, pandas=pd.__version__)
+    with open(output + '.json', 'w') as f:
+        json.dump(dict(meta=meta, results=result.to_dict(orient='records')), f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks hot paths on synthetic gaze recordings')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help='recording length in seconds')
+    parser.add_argument('--rate', type=int, default=500, help='sampling rate in Hz')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory', default=None, help='directory to keep synthetic recordings in')
+    parser.add_argument('--only', nargs='*', default=None, help='substrings of case names to run')
+    parser.add_argument('--output', default='benchmark', help='results path without extension')
+    args = parser.parse_args(argv)
+    result = run(args.directory, args.files, args.duration, args.rate, args.repeats, args.seed, args.only)
+    save(result, args.output, dict(files=args.files, duration=args.duration, rate=args.rate,
+                                   repeats=args.repeats, seed=args.seed))
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Synthetic gaze recordings for benchmarks.
+
+Fixations are drifting points with tremor noise, lasting log-normally distributed times.
+Saccades between them follow the main sequence: duration grows linearly with amplitude and
+the velocity profile is bell-shaped. Blinks are gaps of missing coordinates.
+Files are written in the format of data/debug/debug_files: time in seconds and coordinates normalized to 0..1.
+
+Run from modules/python directory to write files:
+python -m benchmarks.synthetic <directory> --files 10 --duration 60 --rate 500
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def gaze_recording(duration=60, rate=500, seed=0, resolution=(1920, 1080), pixels_per_degree=35,
+                   fixation_duration=.25, blink_rate=.2):
+    """Returns synthetic recording of fixations, saccades and blinks
+
+    :param duration: recording length in seconds
+    :param rate: sampling rate in Hz
+    :param seed: random generator seed, recordings with the same arguments are equal
+    :param resolution: screen resolution in pixels
+    :param pixels_per_degree: pixels in one angular degree, about 35 for 59 cm wide Full HD screen at 50 cm distance
+    :param fixation_duration: median fixation duration in seconds
+    :param blink_rate: blinks per second
+    :return: data frame with 't', 'x' and 'y' columns, coordinates are normalized to 0..1
+    :rtype: pandas.DataFrame
+    """
+    rng = np.random.RandomState(seed)
+    n = int(duration * rate)
+    wpix, hpix = resolution
+    x, y = np.empty(n), np.empty(n)
+    position = np.array([wpix / 2, hpix / 2])
+    i = 0
+    while i < n:
+        # Fixation with slow drift and tremor
+        length = max(int(rng.lognormal(np.log(fixation_duration), .4) * rate), 1)
+        drift = rng.normal(scale=.5 * pixels_per_degree / rate, size=(length, 2)).cumsum(0)
+        points = position + drift + rng.normal(scale=.05 * pixels_per_degree, size=(length, 2))
+        # Saccade to the next target by the main sequence
+        target = rng.uniform([0, 0], [wpix, hpix])
+        amplitude = np.hypot(*(target - position)) / pixels_per_degree
+        saccade = max(int((.021 + .0022 * amplitude) * rate), 1)
+        profile = (1 - np.cos(np.pi * np.arange(1, saccade + 1) / saccade)) / 2
+        points = np.concatenate([points, points[-1] + profile[:, None] * (target - points[-1])])
+        stop = min(i + len(points), n)
+        x[i:stop], y[i:stop] = points[:stop - i, 0], points[:stop - i, 1]
+        position = target
+        i = stop
+
+    for start in rng.randint(0, n, size=rng.poisson(blink_rate * duration)):
+        stop = start + int(rng.uniform(.1, .3) * rate)
+        x[start:stop], y[start:stop] = np.nan, np.nan
+    return pd.DataFrame(dict(t=np.arange(n) / rate, x=x / wpix, y=y / hpix))
+
+
+def write_recordings(directory, files=10, duration=60, rate=500, seed=0, **kwargs):
+    """Writes synthetic recordings to csv files named 'synthetic_<number>.csv'
+
+    :param directory: path to directory, created if missing
+    :param files: number of files
+    :param duration: recording length in seconds
+    :param rate: sampling rate in Hz
+    :param seed: seed of the first file, next files get next seeds
+    :param kwargs: additional gaze_recording arguments
+    :return: paths to written files
+    :rtype: list
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for k in range(files):
+        path = os.path.join(directory, 'synthetic_{}.csv'.format(k))
+        gaze_recording(duration, rate, seed + k, **kwargs).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes synthetic gaze recordings')
+    parser.add_argument('directory')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--rate', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_recordings(args.directory, args.files, args.duration, args.rate, args.seed)
@@ -0,0 +1,288 @@
+import numpy as np
+import pandas as pd
+
+from eyevents.summariser import Summariser
+
+
+class Moments:
+    def __init__(self):
+        """Streaming count, sum, minimum, maximum, mean and variance of values, skipping missing ones.
+        Mean and variance are kept by Welford updates, so merging does not lose precision as sums of squares do"""
+        self.count = 0
+        self.sum = 0.
+        self.mean = np.nan
+        self.m2 = 0.
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values):
+        """Adds values
+
+        :param values: array-like of values
+        :return: self
+        """
+        values = np.asarray(values, float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch = Moments()
+        batch.count = len(values)
+        batch.sum = values.sum()
+        batch.mean = values.mean()
+        batch.m2 = np.sum((values - batch.mean) ** 2)
+        batch.min, batch.max = values.min(), values.max()
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Adds values of other moments, e.g. of another chunk, file or worker
+
+        :param other: Moments
+        :return: self
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.sum += other.sum
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def variance(self, ddof=1):
+        """Returns variance of values, NaN if there are not more than ddof values"""
+        return self.m2 / (self.count - ddof) if self.count > ddof else np.nan
+
+    def std(self, ddof=1):
+        """Returns standard deviation of values"""
+        return np.sqrt(self.variance(ddof))
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=.01):
+        """Approximate quantiles of values with bounded relative error (DDSketch).
+        Values are counted in logarithmic bins, so memory depends on the range of values, not on their number,
+        and sketches of chunks are merged exactly
+
+        :param relative_accuracy: relative error of quantiles
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.positive = dict()
+        self.negative = dict()
+        self.zeros = 0
+        self.count = 0
+
+    def _add(self, bins, values):
+        keys, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            bins[key] = bins.get(key, 0) + count
+
+    def update(self, values):
+        """Adds values, missing ones are skipped
+
+        :param values: array-like of values
+        :return: self
+        """
+        values = np.asarray(values, float).ravel()
+        values = values[~np.isnan(values)]
+        self._add(self.positive, values[values > 0])
+        self._add(self.negative, -values[values < 0])
+        self.zeros += int(np.sum(values == 0))
+        self.count += len(values)
+        return self
+
+    def merge(self, other):
+        """Adds values of other sketch with the same relative accuracy
+
+        :param other: QuantileSketch
+        :return: self
+        """
+        if other.gamma != self.gamma:
+            raise ValueError('Sketches with different relative accuracy can not be merged.')
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Returns approximate quantiles of values
+
+        :param q: quantile or array of quantiles in [0, 1]
+        :return: quantiles, NaN for empty sketch
+        :rtype: float or numpy.ndarray
+        """
+        q = np.asarray(q, float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        keys = np.array(negative + positive, float)
+        values = 2 * self.gamma ** keys / (self.gamma + 1)
+        values[:len(negative)] *= -1
+        values = np.concatenate([values[:len(negative)], [0.], values[len(negative):]])
+        counts = np.array([self.negative[k] for k in negative] + [self.zeros] + [self.positive[k] for k in positive])
+        index = np.searchsorted(np.cumsum(counts), q * (self.count - 1), side='right')
+        return values[np.minimum(index, len(values) - 1)][()]
+
+
+class EventAggregate:
+    # Accumulated characteristics and their columns in Summariser events parameters
+    COLUMNS = dict(duration='duration')
+    # Characteristics with quantile sketches
+    SKETCHED = ('duration',)
+
+    def __init__(self, relative_accuracy=.01):
+        """Mergeable totals of events, reproducing Summariser total parameters without keeping events tables.
+        Memory does not depend on the number of events, so aggregates of chunks, files, subjects or workers
+        are combined by merge into cohort totals
+
+        :param relative_accuracy: relative error of quantile sketches
+        """
+        self.count = 0
+        self.time = 0.
+        self.moments = {name: Moments() for name in self.COLUMNS}
+        self.sketches = {name: QuantileSketch(relative_accuracy) for name in self.SKETCHED}
+
+    def update(self, params, time):
+        """Adds events of a recording or of its chunk. Chunks should be cut between events,
+        otherwise an event on the cut is counted twice
+
+        :param params: events parameters, as Summariser.saccade_params or fixation_params return
+        :param time: maximal time of the recording or of the chunk, for frequencies
+        :return: self
+        """
+        self.count += len(params)
+        self.time = max(self.time, time)
+        for name, column in self.COLUMNS.items():
+            values = params[column].values
+            self.moments[name].update(values)
+            if name in self.sketches:
+                self.sketches[name].update(values)
+        return self
+
+    def merge(self, other, same_recording=False):
+        """Adds events of another aggregate
+
+        :param other: aggregate of the same class
+        :param same_recording: flag, other aggregate has a chunk of the same recording, so the recording time
+        is the maximal one, otherwise times of recordings are summed
+        :return: self
+        """
+        self.count += other.count
+        self.time = max(self.time, other.time) if same_recording else self.time + other.time
+        for name, moments in self.moments.items():
+            moments.merge(other.moments[name])
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        return self
+
+    def frequency(self, count):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.float64(count) / self.time
+
+    def quantiles(self, q=(.25, .5, .75)):
+        """Returns approximate quantiles of the sketched characteristics
+
+        :param q: quantiles in [0, 1]
+        :return: quantiles as index and characteristics as columns
+        :rtype: pandas.DataFrame
+        """
+        q = np.atleast_1d(np.asarray(q, float))
+        return pd.DataFrame({name: sketch.quantile(q) for name, sketch in self.sketches.items()},
+                            index=pd.Index(q, name='quantile'))
+
+    def describe(self):
+        """Returns count, mean, standard deviation, minimum and maximum of every characteristic
+
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame({name: dict(count=m.count, mean=m.mean, std=m.std(), min=m.min, max=m.max)
+                             for name, m in self.moments.items()})
+
+
+class SaccadeAggregate(EventAggregate):
+    COLUMNS = dict(duration='duration', amplitude='amplitude', velocity='meanVelocity')
+    SKETCHED = ('duration', 'amplitude', 'velocity')
+
+    def __init__(self, relative_accuracy=.01):
+        super().__init__(relative_accuracy)
+        self.horis = 0
+        self.vertic = 0
+
+    def update(self, params, time):
+        super().update(params, time)
+        self.horis += int(np.sum(params['orientation'] == 'Horisontal'))
+        self.vertic += int(np.sum(params['orientation'] == 'Vertical'))
+        return self
+
+    def update_events(self, df, mark='Saccade'):
+        """Adds saccades of the events marked data frame
+
+        :param df: events marked data frame
+        :param mark: mark of the Saccades in the df
+        :return: self
+        """
+        return self.update(Summariser.saccade_params(df, mark=mark), max(df.time))
+
+    def merge(self, other, same_recording=False):
+        super().merge(other, same_recording)
+        self.horis += other.horis
+        self.vertic += other.vertic
+        return self
+
+    def totals(self, code=None):
+        """Returns totals in the format of Summariser.total_saccade_params
+
+        :param code: code of the aggregated trials
+        :rtype: pandas.DataFrame
+        """
+        params = dict(
+            count=self.count,
+            freq=self.frequency(self.count),
+            horis=self.horis, vertic=self.vertic,
+            h_freq=self.frequency(self.horis), v_freq=self.frequency(self.vertic),
+            mean_dur=self.moments['duration'].mean,
+            mean_amp=self.moments['amplitude'].mean,
+            mean_vel=self.moments['velocity'].mean,
+            code=code
+        )
+        return pd.DataFrame(params, index=[0])
+
+
+class FixationAggregate(EventAggregate):
+    COLUMNS = dict(duration='duration', area='area')
+    SKETCHED = ('duration',)
+
+    def update_events(self, df, mark='Fixation'):
+        """Adds fixations of the events marked data frame
+
+        :param df: events marked data frame
+        :param mark: mark of the Fixations in the df
+        :return: self
+        """
+        return self.update(Summariser.fixation_params(df, mark=mark), max(df.time))
+
+    def totals(self, code=None):
+        """Returns totals in the format of Summariser.total_fixation_params
+
+        :param code: code of the aggregated trials
+        :rtype: pandas.DataFrame
+        """
+        params = dict(
+            count=self.count,
+            freq=self.frequency(self.count),
+            total_dur=self.moments['duration'].sum,
+            mean_dur=self.moments['duration'].mean,
+            area=self.moments['area'].sum,
+            mean_area=self.moments['area'].mean,
+            code=code
+        )
+        return pd.DataFrame(params, index=[0])
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def read_recording(path, loading, columns):
+    """Loads needed columns of the csv file via pandas.read_csv and renames them.
+    Only the columns set in 'columns' are parsed if all of them are set by positions or all by names
+
+    :param path: path to trajectory file
+    :param loading: pandas.read_csv parameters
+    :param columns: dictionary of new column names and positions or names of the columns in the file.
+    Columns set to None are skipped
+    :return: data frame with the columns in 'columns' order
+    :rtype: pandas.DataFrame
+    """
+    columns = {a: b for a, b in columns.items() if b is not None}
+    loading = dict(loading)
+    positions = list(columns.values())
+    by_position = all(type(b) is int for b in positions)
+    if 'usecols' not in loading and (by_position or all(type(b) is str for b in positions)):
+        loading['usecols'] = sorted(set(positions)) if by_position else positions
+    df = pd.read_csv(path, **loading)
+
+    colnames = df.columns
+    selected = dict()
+    for a, b in columns.items():
+        if type(b) is int:
+            b = colnames[loading['usecols'].index(b)] if 'usecols' in loading and by_position else colnames[b]
+        selected[a] = df[b].values
+    return pd.DataFrame(selected, index=df.index)
+
+
+class RecordingCache:
+    def __init__(self, directory):
+        """Keeps parsed trajectory files as binary .npy columns for fast memory mapped reopening.
+        Entries are keyed by the file content hash and by loading and columns settings
+
+        :param directory: path to cache directory, created if missing
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(path, loading, columns):
+        """Returns cache key of the file content with given loading and columns settings"""
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(repr(sorted(loading.items(), key=str)).encode())
+        digest.update(repr(sorted(columns.items(), key=str)).encode())
+        return digest.hexdigest()
+
+    def read(self, path, loading, columns):
+        """Returns parsed columns of the file, parses it via 'read_recording' and saves on the first call
+
+        :param path: path to trajectory file
+        :param loading: pandas.read_csv parameters
+        :param columns: dictionary of new column names and positions or names of the columns in the file
+        :return: data frame with the columns in 'columns' order
+        :rtype: pandas.DataFrame
+        """
+        entry = os.path.join(self.directory, self.key(path, loading, columns))
+        names = [a for a, b in columns.items() if b is not None]
+        if not os.path.isdir(entry):
+            df = read_recording(path, loading, columns)
+            self.write(entry, df)
+            return df
+        data = dict()
+        for name in names:
+            column = os.path.join(entry, name + '.npy')
+            try:
+                data[name] = np.load(column, mmap_mode='r')
+            except ValueError:
+                data[name] = np.load(column, allow_pickle=True)
+        return pd.DataFrame(data, columns=names)
+
+    def write(self, entry, df):
+        """Saves data frame columns to the cache entry directory"""
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        for name in df.columns:
+            values = df[name].values
+            np.save(os.path.join(tmp, name + '.npy'), values, allow_pickle=values.dtype == object)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # The same entry was written concurrently by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def clear(self):
+        """Removes all cache entries"""
+        for x in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, x), ignore_errors=True)
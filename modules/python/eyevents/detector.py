@@ -1,7 +1,14 @@
 import numpy as np
+import pandas as pd
+from collections import deque
 
 
 class Detector:
+    # Event codes used by array methods, EVENTS[code] is the event mark
+    FIXATION = 0
+    SACCADE = 1
+    EVENTS = np.array(['Fixation', 'Saccade'], dtype=object)
+
     @staticmethod
     def summarise_events(df):
         raise NotImplementedError()
@@ -14,22 +21,178 @@ class Detector:
         :return: df with additional 'group' column
         :rtype: pandas.DataFrame
         """
-        df = df.copy()
-        df.loc[:, 'event_change'] = np.concatenate([[False], np.not_equal(df.iloc[1:]['event'].values, df.iloc[:-1]['event'].values)])
-        df.loc[:, 'group'] = df.event_change.cumsum() + 1
-        df.drop('event_change', 1, inplace=True)
+        df = df.copy(deep=False)
+        df['group'] = Detector.group_codes(df['event'].values)
         return df
 
     @staticmethod
     def smooth_marks(df, window=5, center=True):
-        df = df.copy()
-        df['event2'] = df['event'] == 'Fixation'
-        df.loc[:, 'event2'] = df['event2'].rolling(window, center=center).median()
-        df = df.fillna(method='bfill').fillna(method='ffill')
-        df.loc[:, 'event'] = ['Fixation' if x else 'Saccade' for x in df.event2]
-        df.drop('event2', 1, inplace=True)
+        codes = np.where(df['event'].values == 'Fixation', Detector.FIXATION, Detector.SACCADE).astype(np.int8)
+        df = df.copy(deep=False)
+        df['event'] = Detector.EVENTS[Detector.smooth_codes(codes, window, center)]
+        return df
+
+    @staticmethod
+    def group_codes(codes):
+        """Numbers runs of equal event codes starting with 1
+
+        :param codes: array of event codes or marks
+        :return: group number of every sample
+        :rtype: numpy.ndarray
+        """
+        codes = np.asarray(codes)
+        if len(codes) == 0:
+            return np.empty(0, np.int64)
+        return np.concatenate([[1], 1 + np.cumsum(codes[1:] != codes[:-1])])
+
+    @staticmethod
+    def smooth_codes(codes, window=5, center=True):
+        """Majority smoothing of event codes, the same as rolling median of fixation flags.
+        Samples at the edges without full window get the nearest smoothed value.
+        Two-dimensional arrays are smoothed along rows, e.g. codes for several thresholds
+
+        :param codes: array of Detector.FIXATION and Detector.SACCADE codes
+        :param window: rolling window size
+        :param center: flag, make calculation on the central point, not on the right
+        :return: smoothed codes
+        :rtype: numpy.ndarray
+        """
+        codes = np.asarray(codes)
+        n = codes.shape[-1]
+        if n < window:
+            return np.full(codes.shape, Detector.FIXATION, np.int8)
+        fixations = np.cumsum(codes == Detector.FIXATION, axis=-1)
+        fixations = np.concatenate([np.zeros(codes.shape[:-1] + (1,), fixations.dtype), fixations], axis=-1)
+        majority = 2 * (fixations[..., window:] - fixations[..., :-window]) >= window
+        lag = (window - 1) // 2 if center else 0
+        smoothed = np.empty(codes.shape, bool)
+        smoothed[..., window - 1 - lag:n - lag] = majority
+        smoothed[..., :window - 1 - lag] = majority[..., :1]
+        smoothed[..., n - lag:] = majority[..., -1:]
+        return np.where(smoothed, Detector.FIXATION, Detector.SACCADE).astype(np.int8)
+
+    @staticmethod
+    def compact(df):
+        """Converts 'event' marks to categorical and 'group' numbers to int32 in the shallow copy of df
+
+        :param df: data frame with detected events
+        :return: data frame with compact events columns
+        :rtype: pandas.DataFrame
+        """
+        df = df.copy(deep=False)
+        df['event'] = pd.Categorical(df['event'], categories=Detector.EVENTS)
+        df['group'] = df['group'].astype(np.int32)
+        return df
+
+    @staticmethod
+    def ivt_codes(velocity, threshold, window=5):
+        """Performs velocity threshold detection on the velocities array
+
+        :param velocity: angular velocities array
+        :param threshold: velocity threshold, in angular degrees
+        :param window: window of marks smoothing
+        :return: smoothed event codes
+        :rtype: numpy.ndarray
+        """
+        codes = (np.asarray(velocity) > threshold).astype(np.int8)
+        return Detector.smooth_codes(codes, window, True)
+
+    @staticmethod
+    def ivt_sweep(df, thresholds, window=5):
+        """Performs velocity threshold detection for several thresholds at once and summarises events
+        as Summariser.total_saccade_params and total_fixation_params do, without building events data frames
+
+        :param df: coordinates data frame with 'time', 'xAng', 'yAng' and 'velAng' columns
+        :param thresholds: velocity thresholds, in angular degrees
+        :param window: window of marks smoothing
+        :return: saccades and fixations counts, frequencies, mean durations, saccades mean amplitudes and
+        velocities and fixations total durations for every threshold
+        :rtype: pandas.DataFrame
+        """
+        thresholds = np.asarray(thresholds, float).ravel()
+        time = df['time'].values.astype(float)
+        x, y = df['xAng'].values.astype(float), df['yAng'].values.astype(float)
+        velocity = df['velAng'].values.astype(float)
+        n, k = len(time), len(thresholds)
+
+        codes = Detector.smooth_codes((velocity[None, :] > thresholds[:, None]).astype(np.int8), window, True)
+        # Runs of equal codes in every row, their rows, first and last samples
+        starts = np.ones(codes.shape, bool)
+        starts[:, 1:] = codes[:, 1:] != codes[:, :-1]
+        rows, first = np.nonzero(starts)
+        last = np.empty_like(first)
+        last[:-1] = first[1:] - 1
+        # The last event of every row, no events for empty trajectory
+        new_row = np.append(rows[1:] != rows[:-1], True)[:len(rows)]
+        last[new_row] = n - 1
+        event_codes = codes[rows, first]
+
+        def reduce(ufunc, values):
+            # Reduction over first..last samples of every event via pairs of reduceat indices
+            bounds = np.stack([first, last + 1], 1).ravel()
+            return ufunc.reduceat(np.append(values, np.nan), bounds)[::2]
+
+        def mean(values):
+            valid = ~np.isnan(values)
+            sums = np.concatenate([[0], np.cumsum(np.where(valid, values, 0))])
+            counts = np.concatenate([[0], np.cumsum(valid)])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (sums[last + 1] - sums[first]) / (counts[last + 1] - counts[first])
+
+        def per_threshold(values, mask, total=False):
+            valid = mask & ~np.isnan(values)
+            sums = np.bincount(rows[valid], weights=values[valid], minlength=k)
+            if total:
+                return sums
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return sums / np.bincount(rows[valid], minlength=k)
+
+        duration = reduce(np.fmax, time) - reduce(np.fmin, time)
+        with np.errstate(invalid='ignore'):
+            amplitude = np.where(first == last, np.nan, np.hypot(x[first] - x[last], y[first] - y[last]))
+        saccades = event_codes == Detector.SACCADE
+        fixations = event_codes == Detector.FIXATION
+        total_duration = np.nanmax(time) if n else np.nan
+
+        result = pd.DataFrame(dict(
+            sac_count=np.bincount(rows[saccades], minlength=k),
+            sac_mean_dur=per_threshold(duration, saccades),
+            sac_mean_amp=per_threshold(amplitude, saccades),
+            sac_mean_vel=per_threshold(mean(velocity), saccades),
+            fix_count=np.bincount(rows[fixations], minlength=k),
+            fix_total_dur=per_threshold(duration, fixations, total=True),
+            fix_mean_dur=per_threshold(duration, fixations),
+        ), index=pd.Index(thresholds, name='threshold'))
+        result.insert(1, 'sac_freq', result['sac_count'] / total_duration)
+        result.insert(6, 'fix_freq', result['fix_count'] / total_duration)
+        return result
+
+    @staticmethod
+    def codes_frame(df, codes):
+        """Adds 'event' marks and 'group' numbers of event codes to the shallow copy of df
+
+        :param df: coordinates data frame
+        :param codes: event codes of df samples
+        :return: data frame with additional 'event' and 'group' columns
+        :rtype: pandas.DataFrame
+        """
+        df = df.copy(deep=False)
+        df['event'] = Detector.EVENTS[codes]
+        df['group'] = Detector.group_codes(codes)
         return df
 
+    @staticmethod
+    def detect(df, settings):
+        """Performs oculomotor events detection by the method set in settings oculus field
+
+        :param df: coordinates data frame
+        :param settings: settings dictionary with filled oculus field
+        :return: data frame with additional parameters
+        :rtype: pandas.DataFrame
+        """
+        methods = dict(IVT=Detector.ivt, IDT=Detector.idt, ANH=Detector.anh)
+        return methods[settings['oculus']['method']](df, settings)
+
     @staticmethod
     def blinker(df, settings):
         """Performs blinks detection in one of several ways
@@ -51,18 +214,152 @@ class Detector:
         :return: data frame with additional parameters
         :rtype: pandas.DataFrame
         """
-        df = df.copy()
-        df['above_threshold'] = df['velAng'] > settings['oculus']['velocity_threshold']
-        df['event'] = df['above_threshold'].replace([True, False], ['Saccade', 'Fixation'])
-        df.drop('above_threshold', 1, inplace=True)
-        df = Detector.smooth_marks(df, 5, True)
-        df = Detector.group_events(df)
-        return df
+        codes = Detector.ivt_codes(df['velAng'].values, settings['oculus']['velocity_threshold'])
+        return Detector.codes_frame(df, codes)
 
     @staticmethod
     def idt(df, settings):
-        raise NotImplementedError('Method is under construction')
+        """Performs basic oculomotor events detections by dispersion threshold.
+        Basic events are: fixations, saccades
+
+        :param df: coordinates data frame
+        :param settings: settings dictionary with filled oculus field
+        :return: data frame with additional parameters
+        :rtype: pandas.DataFrame
+        """
+        codes = Detector.idt_codes(df['time'].values, df['xAng'].values, df['yAng'].values,
+                                   settings['oculus']['dispersion_threshold'], settings['oculus']['duration_threshold'])
+        return Detector.codes_frame(df, codes)
+
+    @staticmethod
+    def idt_codes(time, x, y, dispersion_threshold, duration_threshold):
+        """Performs dispersion threshold detection on the coordinates arrays.
+        Window maximums and minimums are kept in monotonic deques, so every sample is added and removed once
+        and the detection is linear in the recording length
+
+        :param time: timestamps array, non-decreasing
+        :param x: angular x-coordinates array
+        :param y: angular y-coordinates array
+        :param dispersion_threshold: maximal fixation dispersion (x range plus y range), in angular degrees
+        :param duration_threshold: minimal fixation duration, in time units
+        :return: event codes
+        :rtype: numpy.ndarray
+        """
+        n = len(time)
+        codes = np.full(n, Detector.SACCADE, np.int8)
+        t, x, y = np.asarray(time, float).tolist(), np.asarray(x, float).tolist(), np.asarray(y, float).tolist()
+        # (values, deque of window indices, sign): sign 1 keeps maximum at the front, -1 keeps minimum
+        windows = [(x, deque(), 1), (x, deque(), -1), (y, deque(), 1), (y, deque(), -1)]
+
+        def push(k):
+            for values, window, sign in windows:
+                while window and sign * values[window[-1]] <= sign * values[k]:
+                    window.pop()
+                window.append(k)
+
+        def dispersion(k):
+            """Dispersion of the current window extended by sample k"""
+            (_, xmax, _), (_, xmin, _), (_, ymax, _), (_, ymin, _) = windows
+            return (max(x[xmax[0]], x[k]) - min(x[xmin[0]], x[k])) + (max(y[ymax[0]], y[k]) - min(y[ymin[0]], y[k]))
+
+        i, j = 0, -1
+        while i < n:
+            for _, window, _ in windows:
+                while window and window[0] < i:
+                    window.popleft()
+            if j < i:
+                j = i
+                push(i)
+            while j + 1 < n and t[j] - t[i] < duration_threshold:
+                j += 1
+                push(j)
+            if t[j] - t[i] < duration_threshold:
+                break
+            if dispersion(j) <= dispersion_threshold:
+                while j + 1 < n and dispersion(j + 1) <= dispersion_threshold:
+                    j += 1
+                    push(j)
+                codes[i:j + 1] = Detector.FIXATION
+                for _, window, _ in windows:
+                    window.clear()
+                i = j + 1
+            else:
+                i += 1
+        return codes
 
     @staticmethod
     def anh(df, settings):
-        raise NotImplementedError('Method is under construction')
+        """Performs basic oculomotor events detections by adaptive velocity thresholds (Nystrom and Holmqvist).
+        Basic events are: fixations, saccades
+
+        :param df: coordinates data frame
+        :param settings: settings dictionary with filled oculus field
+        :return: data frame with additional parameters
+        :rtype: pandas.DataFrame
+        """
+        velocity = df['velAng'].values
+        peak, onset = Detector.anh_thresholds(velocity, settings['oculus'].get('initial_threshold', 100))
+        return Detector.codes_frame(df, Detector.anh_codes(velocity, peak, onset))
+
+    @staticmethod
+    def anh_thresholds(velocities, initial_threshold=100, peak_sd=6, onset_sd=3, tolerance=1, max_iterations=100):
+        """Calculates adaptive velocity thresholds. Peak threshold is iteratively set to mean plus peak_sd standard
+        deviations of velocities below it until it changes less than tolerance. Several trajectories are processed
+        at once, iterations stop for every trajectory when its threshold converges
+
+        :param velocities: angular velocities array, or list of arrays for several trajectories
+        :param initial_threshold: initial peak threshold
+        :param peak_sd: number of standard deviations for peak threshold
+        :param onset_sd: number of standard deviations for saccade onset threshold
+        :param tolerance: convergence tolerance
+        :param max_iterations: maximal number of iterations
+        :returns: peak and onset thresholds, numbers or arrays for a list of trajectories
+        :rtype: (float, float) or (numpy.ndarray, numpy.ndarray)
+        """
+        single = not isinstance(velocities, (list, tuple)) and np.ndim(velocities) == 1
+        rows = [np.asarray(velocities, float)] if single else [np.asarray(x, float) for x in velocities]
+        # Velocities below a threshold are a prefix of the sorted ones, so every iteration takes their sums
+        # from prefix sums of the sorted velocities computed once instead of passing over the velocities.
+        # Prefix sums start from zero in every trajectory and are taken around its median to keep variances precise
+        rows = [np.sort(x[~np.isnan(x)]) for x in rows]
+        starts = np.concatenate([[0], np.cumsum([len(x) + 1 for x in rows])[:-1]]).astype(int)
+        shift = np.array([x[len(x) // 2] if len(x) else 0. for x in rows])
+        sums = np.concatenate([np.cumsum(np.append(0., x - c)) for x, c in zip(rows, shift)] + [np.empty(0)])
+        squares = np.concatenate([np.cumsum(np.append(0., (x - c) ** 2)) for x, c in zip(rows, shift)] + [np.empty(0)])
+
+        peak = np.full(len(rows), float(initial_threshold))
+        mean, sd = np.full(len(rows), np.nan), np.full(len(rows), np.nan)
+        active = np.arange(len(rows))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for _ in range(max_iterations):
+                count = np.array([np.searchsorted(rows[i], peak[i]) for i in active], int)
+                first, last = starts[active], starts[active] + count
+                row_mean = (sums[last] - sums[first]) / count
+                mean[active] = shift[active] + row_mean
+                sd[active] = np.sqrt(np.maximum((squares[last] - squares[first]) / count - row_mean ** 2, 0))
+                new_peak = mean[active] + peak_sd * sd[active]
+                converged = ~(np.abs(new_peak - peak[active]) >= tolerance)
+                peak[active] = new_peak
+                active = active[~converged]
+                if len(active) == 0:
+                    break
+        onset = mean + onset_sd * sd
+        return (peak[0], onset[0]) if single else (peak, onset)
+
+    @staticmethod
+    def anh_codes(velocity, peak_threshold, onset_threshold):
+        """Marks as saccades runs of velocities above onset threshold, which reach peak threshold
+
+        :param velocity: angular velocities array
+        :param peak_threshold: saccade peak velocity threshold
+        :param onset_threshold: saccade onset and offset velocity threshold
+        :return: event codes
+        :rtype: numpy.ndarray
+        """
+        velocity = np.asarray(velocity, float)
+        above = velocity > onset_threshold
+        groups = Detector.group_codes(above)
+        starts = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]])) if len(groups) else groups
+        peaks = np.maximum.reduceat(velocity, starts) if len(starts) else velocity
+        saccades = above[starts] & (peaks > peak_threshold)
+        return np.where(saccades[groups - 1], Detector.SACCADE, Detector.FIXATION).astype(np.int8)
@@ -1,22 +1,39 @@
 import numpy as np
 import pandas as pd
 from os import listdir
+from itertools import repeat
+from functools import partial
 
 from eyevents.extended_trajectory import ExtendedTrajectory
-from eyevents.detector import Detector
-from eyevents.summariser import Summariser
+from eyevents.trajectories import Trajectories, process_trajectory, map_trajectories
+from eyevents.pipeline import StageCache
+from eyevents.profiler import null_profiler
 from eyevents.utils import get_shortname
 
-from tqdm import tqdm_notebook
-
 
 class ExtendedTrajectories:
-    def __init__(self, directory, settings=None, stimulus_pathes=None):
+    def __init__(self, directory, settings=None, stimulus_pathes=None, n_jobs=None, executor=None, progress=None,
+                 chunk_size=None, log_likelihood_path=None, cache=None, compact=False, drop_columns=None,
+                 profiler=None, sparse=False, stage_cache=None, likelihood_path=None):
         """Contains trajectories with events and their parameters.
 
         :param directory: path to trajectory files in the same format
         :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
         :param stimulus_pathes: pathes list of stimulus files
+        :param n_jobs: number of worker processes to build trajectories, None for serial run, -1 for all processors
+        :param executor: concurrent.futures.Executor to build trajectories with instead of process pool
+        :param progress: progress consumer wrapping results iterator as tqdm does, None for tqdm, False to disable
+        :param chunk_size: number of rows of likelihood matrices calculated at once, None for all rows
+        :param log_likelihood_path: path to .npy file to keep log-likelihood matrix as memory map, None to keep in memory
+        :param cache: RecordingCache or path to its directory to keep parsed files in, None to parse every time
+        :param compact: flag, keep kinematics as float32, events marks as categorical and release intermediate stages
+        :param drop_columns: columns to drop from trajectories df in compact mode, e.g. Trajectory.INTERMEDIATE_COLUMNS
+        :param profiler: eyevents.profiler.Profiler collecting stages measures of all files, None to skip measuring.
+        Its records are kept in profiler attribute, see its to_df and summary methods
+        :param sparse: flag, keep transition matrices and their stacks as scipy.sparse.csr_matrix for fine AOI grids
+        :param stage_cache: eyevents.pipeline.StageCache or path to its disk tier directory to take stages results
+        from, e.g. when the directory is processed with several settings variants. Worker processes share disk tier only
+        :param likelihood_path: path to .npy file to keep likelihood matrix as memory map, None to keep in memory
         """
         if stimulus_pathes is None:
             raise TypeError('You should use Trajectories class.')
@@ -26,37 +43,47 @@ class ExtendedTrajectories:
         shortnames = [get_shortname(x) for x in files]
         if len(stimulus_pathes) != len(shortnames):
             raise ValueError('Different lengths of files.')
-        self.trajectories = {get_shortname(x): ExtendedTrajectory(x, settings, stim) for x, stim in zip(files,stimulus_pathes)}
+        self.profiler = null_profiler if profiler is None else profiler
+        if isinstance(stage_cache, str):
+            stage_cache = StageCache(directory=stage_cache)
+        results = map_trajectories(partial(process_trajectory, cache=cache, compact=compact,
+                                           drop_columns=drop_columns, profiler=profiler, sparse=sparse,
+                                           stage_cache=stage_cache),
+                                   repeat(ExtendedTrajectory, len(files)), files,
+                                   repeat(settings, len(files)), stimulus_pathes,
+                                   n_jobs=n_jobs, executor=executor, progress=progress)
+        self.trajectories = {}
         self.dfs = {}
         all_saccades = []
         total_saccades = []
         all_fixations = []
         total_fixations = []
-        for key, val in tqdm_notebook(self.trajectories.items()):
-            detd_df = Detector.ivt(val.df, settings)
-            buf_sac = Summariser.total_saccade_params(detd_df, val.name)
-            buf_fix = Summariser.total_fixation_params(detd_df, val.name)
+        for trajectory, detd_df, buf_sac, buf_fix in results:
             all_saccades.append(buf_sac[0])
             total_saccades.append(buf_sac[1])
             all_fixations.append(buf_fix[0])
             total_fixations.append(buf_fix[1])
-            self.dfs[key] = detd_df
+            self.trajectories[trajectory.name] = trajectory
+            self.dfs[trajectory.name] = detd_df
+            self.profiler.extend(trajectory.profiler.records)
 
         self.all_saccades = pd.concat(all_saccades, ignore_index=True)
         self.total_saccades = pd.concat(total_saccades, ignore_index=True)
         self.all_fixations = pd.concat(all_fixations, ignore_index=True)
         self.total_fixations = pd.concat(total_fixations, ignore_index=True)
 
-        likelihoods_mask = pd.DataFrame(np.zeros((len(files), len(files))), columns=shortnames, index=shortnames)
-        self.df_likelihood = likelihoods_mask.copy()
-        self.df_log_likelihood = likelihoods_mask.copy()
-        for row in shortnames:
-            for col in shortnames:
-                transitions = self.trajectories[row].transition_count
-                probabilities = self.trajectories[col].transition_probability
-                log_probabilities = self.trajectories[col].transition_log_probability
-                self.df_likelihood.loc[row, col] = ExtendedTrajectories.get_likelihood(transitions, probabilities)
-                self.df_log_likelihood.loc[row, col] = ExtendedTrajectories.get_log_likelihood(transitions, log_probabilities)
+        with self.profiler.stage('Trajectories.stack_transitions'):
+            counts, probabilities, log_probabilities = Trajectories.stack_transitions(
+                [self.trajectories[x] for x in shortnames])
+        with self.profiler.stage('Trajectories.get_likelihoods'):
+            likelihoods = Trajectories.get_likelihoods(counts, probabilities, chunk_size, likelihood_path)
+        with self.profiler.stage('Trajectories.get_log_likelihoods'):
+            log_likelihoods = Trajectories.get_log_likelihoods(counts, log_probabilities, chunk_size,
+                                                               log_likelihood_path)
+        # Stacks are as large as the trajectories transition matrices together, they are not kept
+        del counts, probabilities, log_probabilities
+        self.df_likelihood = pd.DataFrame(likelihoods, columns=shortnames, index=shortnames)
+        self.df_log_likelihood = pd.DataFrame(log_likelihoods, columns=shortnames, index=shortnames)
 
         self.df_entropies = pd.DataFrame([self.trajectories[x].entropy for x in shortnames],
                                          columns=['Entropy'], index=shortnames)
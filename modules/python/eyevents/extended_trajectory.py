@@ -1,41 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 from matplotlib import image as img
 
 from eyevents.trajectory import Trajectory
 
 
+class StimulusCache:
+    def __init__(self, max_bytes=512 * 2**20):
+        """Keeps decoded and normalized stimulus matrices, the least recently used ones are dropped
+        when total size exceeds max_bytes. Keyed by file path and modification time, safe to use from threads
+
+        :param max_bytes: memory cap in bytes
+        """
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def decode(path):
+        """Reads green channel of the stimulus image normalized to sum 1"""
+        a = img.imread(path)[..., 1]
+        return a / a.sum()
+
+    def get(self, path):
+        """Returns read-only normalized stimulus matrix, decodes the file only if it is not cached"""
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        matrix = self.decode(path)
+        matrix.flags.writeable = False
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = matrix
+                self.nbytes += matrix.nbytes
+            while self.nbytes > self.max_bytes and len(self.items) > 1:
+                _, dropped = self.items.popitem(last=False)
+                self.nbytes -= dropped.nbytes
+            return self.items.get(key, matrix)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+
+# Process-wide cache shared by all extended trajectories
+stimulus_cache = StimulusCache()
+
+
 class ExtendedTrajectory(Trajectory):
-    def __init__(self, path, settings, stimulus=None):
+    def __init__(self, path, settings, stimulus=None, lazy=False, cache=None, compact=False, drop_columns=None,
+                 profiler=None, sparse=False, stage_cache=None):
         """Contains one trajectory values and additional parameters (velocities etc.)
         Can handle stimulus matrix for additional entropy calculation
 
         :param path: path to trajectory file
         :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
-        :param stimulus: path to stimulus file
+        :param stimulus: path to stimulus file or stimulus matrix of resolution[1] rows and resolution[0] columns,
+        e.g. eyevents.heatmaps.Heatmap.to_stimulus result
+        :param lazy: flag, calculate every stage on the first access instead of calculating all of them at once
+        :param cache: RecordingCache or path to its directory to keep parsed files in, None to parse every time
+        :param compact: flag, keep kinematics as float32 and release intermediate stages once next stages are calculated
+        :param drop_columns: columns to drop from df in compact mode, e.g. Trajectory.INTERMEDIATE_COLUMNS
+        :param profiler: eyevents.profiler.Profiler to measure the stages with, None to skip measuring
+        :param sparse: flag, keep transition matrices as scipy.sparse.csr_matrix for fine AOI grids
+        :param stage_cache: eyevents.pipeline.StageCache or path to its disk tier directory to share stages results
         """
-        super().__init__(path, settings)
+        super().__init__(path, settings, lazy, cache, compact, drop_columns, profiler, sparse, stage_cache)
         self.stimulus = None
-        self.informativity = None
-        query = 'porx > 0 & porx < 1920 & pory > 0 & pory < 1200'
-        vals = self.df.query(query)[['porx', 'pory']].astype(np.int).values
-        self.x, self.y = vals[..., 0], vals[..., 1]
         self.get_stimulus_matrix(stimulus)
 
+    @property
+    def screen_points(self):
+        """Returns integer pixel coordinates of the samples inside the screen, read from the current df stage"""
+        width, height = self.settings['common']['resolution']
+        x, y = self.df['porx'].values, self.df['pory'].values
+        inside = (x > 0) & (x < width) & (y > 0) & (y < height)
+        return x[inside].astype(int), y[inside].astype(int)
+
+    @property
+    def x(self):
+        return self.screen_points[0]
+
+    @property
+    def y(self):
+        return self.screen_points[1]
+
+    @property
+    def informativity(self):
+        """Informativity of the trajectory on the stimulus, None without stimulus"""
+        if self.stimulus is None:
+            return None
+        x, y = self.screen_points
+        n = len(x)
+        coords_path = self.stimulus[y, x]
+        entropy = -np.sum(coords_path * np.log2(coords_path))
+
+        bais = np.log2(n)
+        return bais - entropy
+
     def get_stimulus_matrix(self, stimulus):
         if stimulus is None:
             self.stimulus = None
-            self.informativity = None
+        elif isinstance(stimulus, np.ndarray):
+            width, height = self.settings['common']['resolution']
+            if stimulus.shape != (height, width):
+                raise ValueError('Stimulus matrix shape must be (resolution[1], resolution[0]).')
+            self.stimulus = stimulus / stimulus.sum()
         else:
-            a = img.imread(stimulus)[..., 1]
-            norm = a / a.sum()
-            self.stimulus = norm
-
-            n = len(self.x)
-            coords_path = []
-            for x, y in zip(self.x, self.y):
-                coords_path.append(self.stimulus[y][x])
-            coords_path = np.array(coords_path)
-            entropy = -np.sum(coords_path * np.log2(coords_path))
-
-            bais = np.log2(n)
-            self.informativity = bais - entropy
+            self.stimulus = stimulus_cache.get(stimulus)
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter
+
+from eyevents.utils import angular_to_pixels, pixels_per_degree
+
+
+class Heatmap:
+    def __init__(self, settings, bin_size=1):
+        """Fixation density map of the screen. Keeps unsmoothed sums of fixations weights in bins of pixels,
+        so maps of subjects are reduced into group maps by merge and smoothed once at the end
+
+        :param settings: settings dictionary with filled common field
+        :param bin_size: bin side in pixels, 1 for the screen resolution
+        """
+        self.settings = settings
+        self.bin_size = bin_size
+        self.shape = Heatmap.bins_shape(settings, bin_size)
+        self.counts = np.zeros(self.shape)
+        self.maps = 0
+
+    @staticmethod
+    def bins_shape(settings, bin_size=1):
+        """Returns numbers of bins rows and columns, as of stimulus matrix"""
+        wpix, hpix = settings['common']['resolution']
+        return int(np.ceil(hpix / bin_size)), int(np.ceil(wpix / bin_size))
+
+    @staticmethod
+    def bin_fixations(fixations, settings, bin_size=1, weights='duration'):
+        """Finds bins of fixations centres. Fixations outside the screen or without centres are dropped
+
+        :param fixations: fixations parameters with 'centerX' and 'centerY' columns, e.g. Trajectories.all_fixations
+        :param settings: settings dictionary with filled common field
+        :param bin_size: bin side in pixels
+        :param weights: column of fixations weights, e.g. 'duration', None for counts
+        :return: mask of binned fixations, their flat bin indices and weights
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        cols = Heatmap.bins_shape(settings, bin_size)[1]
+        x, y = angular_to_pixels(fixations['centerX'].values, fixations['centerY'].values, settings)
+        w = np.ones(len(x)) if weights is None else fixations[weights].values.astype(float)
+        wpix, hpix = settings['common']['resolution']
+        with np.errstate(invalid='ignore'):
+            valid = (x >= 0) & (x < wpix) & (y >= 0) & (y < hpix) & ~np.isnan(w)
+        index = (y[valid] // bin_size).astype(np.int64) * cols + (x[valid] // bin_size).astype(np.int64)
+        return valid, index, w[valid]
+
+    def add(self, fixations, weights='duration', normalize=False):
+        """Adds fixations, e.g. of one subject
+
+        :param fixations: fixations parameters with 'centerX' and 'centerY' columns
+        :param weights: column of fixations weights, e.g. 'duration', None for counts
+        :param normalize: flag, scale the weights to sum 1, so every added map counts equally in the group
+        :return: self
+        """
+        _, index, w = Heatmap.bin_fixations(fixations, self.settings, self.bin_size, weights)
+        if normalize and w.sum() > 0:
+            w = w / w.sum()
+        self.counts += np.bincount(index, w, self.counts.size).reshape(self.shape)
+        self.maps += 1
+        return self
+
+    def merge(self, other):
+        """Adds sums of another map with the same bins
+
+        :param other: Heatmap
+        :return: self
+        """
+        if other.shape != self.shape:
+            raise ValueError('Heatmaps with different bins can not be merged.')
+        self.counts += other.counts
+        self.maps += other.maps
+        return self
+
+    def density(self, sigma=1.):
+        """Returns map smoothed by separable Gaussian filter and normalized to sum 1
+
+        :param sigma: standard deviation of Gaussian kernel, in angular degrees, 0 for no smoothing
+        :return: density matrix of bins
+        :rtype: numpy.ndarray
+        """
+        result = self.counts
+        if sigma:
+            ppd_x, ppd_y = pixels_per_degree(self.settings)
+            result = gaussian_filter(result, (sigma * ppd_y / self.bin_size, sigma * ppd_x / self.bin_size),
+                                     mode='constant')
+        total = result.sum()
+        return result / total if total > 0 else result.copy()
+
+    def to_stimulus(self, sigma=1., uniform=1e-6):
+        """Returns density with the screen resolution, in the format of ExtendedTrajectory stimulus matrix.
+        Density is mixed with uniform one, so no pixel has zero probability and stimulus entropy is finite
+
+        :param sigma: standard deviation of Gaussian kernel, in angular degrees
+        :param uniform: weight of uniform density in the mix, in (0, 1]
+        :return: matrix of resolution[1] rows and resolution[0] columns normalized to sum 1
+        :rtype: numpy.ndarray
+        """
+        result = self.density(sigma)
+        if self.bin_size != 1:
+            wpix, hpix = self.settings['common']['resolution']
+            result = np.repeat(np.repeat(result, self.bin_size, 0), self.bin_size, 1)[:hpix, :wpix]
+        total = result.sum()
+        if total > 0:
+            result = (1 - uniform) * result / total + uniform / result.size
+        else:
+            result = np.full(result.shape, 1 / result.size)
+        return result
+
+    @staticmethod
+    def group_heatmaps(fixations, settings, by='code', groups=None, bin_size=1, weights='duration',
+                       normalize=True):
+        """Builds maps of all groups in one pass: fixations of all trajectories are binned by one bincount
+
+        :param fixations: fixations parameters of all trajectories, e.g. Trajectories.all_fixations
+        :param settings: settings dictionary with filled common field
+        :param by: column of trajectory names
+        :param groups: dictionary of trajectory names and their groups, None for a map of every trajectory
+        :param bin_size: bin side in pixels
+        :param weights: column of fixations weights, e.g. 'duration', None for counts
+        :param normalize: flag, scale weights of every trajectory to sum 1, so trajectories count equally in groups
+        :return: dictionary of groups and their heatmaps
+        :rtype: dict
+        """
+        valid, index, w = Heatmap.bin_fixations(fixations, settings, bin_size, weights)
+        names = fixations[by].values[valid]
+        if normalize:
+            name_codes, name_index = np.unique(names, return_inverse=True)
+            totals = np.bincount(name_index, w, len(name_codes))
+            totals = totals[name_index]
+            w = np.divide(w, totals, out=np.zeros_like(w), where=totals > 0)
+        all_names = pd.unique(fixations[by])
+        labels = pd.Series(all_names if groups is None else [groups[x] for x in all_names], index=all_names)
+        group_names = pd.unique(labels.values)
+        group_index = pd.Index(group_names).get_indexer(labels.reindex(names).values)
+
+        shape = Heatmap.bins_shape(settings, bin_size)
+        size = shape[0] * shape[1]
+        counts = np.bincount(group_index * size + index, w, len(group_names) * size)
+        counts = counts.reshape((len(group_names),) + shape)
+        maps = labels.value_counts()
+
+        result = dict()
+        for i, group in enumerate(group_names):
+            heatmap = Heatmap(settings, bin_size)
+            heatmap.counts = counts[i]
+            heatmap.maps = int(maps.loc[group])
+            result[group] = heatmap
+        return result
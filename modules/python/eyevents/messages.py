@@ -52,8 +52,11 @@ settings = dict(
     ),
     # Настройки определения окуломоторных событий
     oculus=dict(
-        method='IVT',  # метод определения (только IVT на данный момент)
+        method='IVT',  # метод определения: IVT, IDT или ANH
         velocity_threshold=30,  # порог скорости для IVT-детектора
+        dispersion_threshold=1.5,  # порог дисперсии для IDT-детектора в угловых градусах
+        duration_threshold=0.1,  # минимальная длительность фиксации для IDT-детектора в единицах столбца времени
+        initial_threshold=100,  # начальный порог пиковой скорости для ANH-детектора, можно не задавать
     )
 )""",
         eng="""Settings must be set as follows:
@@ -99,8 +102,11 @@ settings = dict(
     ),
     # contains oculomotor events detectors settings
     oculus=dict(
-        method='IVT',  # chosen detection method
+        method='IVT',  # chosen detection method, one of [IVT, IDT, ANH]
         velocity_threshold=30,  # velocity threshold for IVT detector, in angular degrees
+        dispersion_threshold=1.5,  # dispersion threshold for IDT detector, in angular degrees
+        duration_threshold=0.1,  # minimal fixation duration for IDT detector, in time column units
+        initial_threshold=100,  # initial peak velocity threshold for ANH detector, not necessary
     )
 )"""
     ),
@@ -231,15 +237,21 @@ If Savitzky-Golay was chosen as method:
     SETTINGS_OCULUS_ERROR=dict(
         rus="""Настройки определения окуломоторных событий должны иметь следующий вид:
     oculus=dict(
-        method='IVT',  # метод определения (только IVT на данный момент)
+        method='IVT',  # метод определения: IVT, IDT или ANH
         velocity_threshold=30,  # порог скорости для IVT-детектора
+        dispersion_threshold=1.5,  # порог дисперсии для IDT-детектора в угловых градусах
+        duration_threshold=0.1,  # минимальная длительность фиксации для IDT-детектора в единицах столбца времени
+        initial_threshold=100,  # начальный порог пиковой скорости для ANH-детектора, можно не задавать
     )
-    Другие методы определения событий в разработке""",
+    Для каждого метода необходимо задать только его параметры. Другие методы определения событий в разработке""",
         eng="""Oculomotor events detectors settings must be set as follow:
     oculus=dict(
-        method='IVT',  # chosen detection method (only IVT at present)
+        method='IVT',  # chosen detection method, one of [IVT, IDT, ANH]
         velocity_threshold=30,  # velocity threshold for IVT detector, in angular degrees
+        dispersion_threshold=1.5,  # dispersion threshold for IDT detector, in angular degrees
+        duration_threshold=0.1,  # minimal fixation duration for IDT detector, in time column units
+        initial_threshold=100,  # initial peak velocity threshold for ANH detector, not necessary
     )
-    Other event detectors are in development"""
+    Only the parameters of the chosen method are necessary. Other event detectors are in development"""
     )
 )
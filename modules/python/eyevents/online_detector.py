@@ -0,0 +1,278 @@
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import savgol_coeffs
+
+from eyevents.values_checker import ValuesChecker
+
+
+Event = namedtuple('Event', ['group', 'event', 'start', 'end', 'nsamples'])
+
+
+def savgol_edge(order, deriv=0):
+    """Returns edge function fitting polynomial to the window as scipy.signal.savgol_filter does in 'interp' mode"""
+    def edge(window, positions):
+        coefs = np.polyfit(np.arange(len(window)), window, order)
+        return np.stack([np.polyval(np.polyder(coefs[:, j], deriv), positions) for j in range(window.shape[1])], 1)
+    return edge
+
+
+class WindowFilter:
+    def __init__(self, window, lag, func, columns, edge=None):
+        """Applies function to sliding windows of the stream. Only the last samples of the stream are kept.
+
+        :param window: window length in samples
+        :param lag: number of samples after the output position in the window, (window - 1) // 2 for centered windows
+        :param func: function getting windows of (n, len(columns), window) shape and returning (n, len(columns)) outputs
+        :param columns: filtered columns numbers, other columns are passed through
+        :param edge: function getting window of (window, len(columns)) shape and positions in it
+        and returning outputs for the positions at the stream edges, None to output missing values there
+        """
+        self.window = window
+        self.lag = lag
+        self.func = func
+        self.columns = columns
+        self.edge = edge
+        self.buffer = None
+        self.last = None
+
+    def _edge(self, window, positions):
+        out = window[positions].copy()
+        if self.edge is None:
+            out[:, self.columns] = np.nan
+        else:
+            out[:, self.columns] = self.edge(window[:, self.columns], positions)
+        return out
+
+    def push(self, data):
+        """Adds samples to the stream
+
+        :param data: samples array of (n, columns) shape
+        :return: outputs for all the positions having full window
+        :rtype: numpy.ndarray
+        """
+        w, lag = self.window, self.lag
+        if self.buffer is not None:
+            data = np.concatenate([self.buffer, data])
+        outs = [data[:0]]
+        if len(data) >= w:
+            if self.last is None:
+                outs.append(self._edge(data[:w], np.arange(w - 1 - lag)))
+            out = data[w - 1 - lag:len(data) - lag].copy()
+            out[:, self.columns] = self.func(sliding_window_view(data[:, self.columns], w, axis=0))
+            outs.append(out)
+            self.last = data[-w:]
+        self.buffer = data[max(len(data) - w + 1, 0):]
+        return np.concatenate(outs)
+
+    def flush(self):
+        """Finishes the stream
+
+        :return: outputs for the last positions
+        :rtype: numpy.ndarray
+        """
+        if self.buffer is None:
+            return np.empty((0, 0))
+        if self.last is None:
+            out = self.buffer.copy()
+            out[:, self.columns] = np.nan
+        else:
+            out = self._edge(self.last, np.arange(self.window - self.lag, self.window))
+        self.buffer, self.last = None, None
+        return out
+
+
+class BackFill:
+    def __init__(self, columns):
+        """Fills missing values of the stream as pandas fillna with 'bfill' and then 'ffill' methods does.
+        Samples are held until the next valid value arrives
+
+        :param columns: filled columns numbers
+        """
+        self.columns = columns
+        self.pending = None
+        self.last = None
+
+    @staticmethod
+    def _next_valid(values):
+        n = len(values)
+        index = np.where(np.isnan(values), n, np.arange(n)[:, None])
+        return np.minimum.accumulate(index[::-1], axis=0)[::-1]
+
+    def push(self, data):
+        """Adds samples to the stream
+
+        :param data: samples array of (n, columns) shape
+        :return: filled samples, which have valid values after them
+        :rtype: numpy.ndarray
+        """
+        if self.pending is not None:
+            data = np.concatenate([self.pending, data])
+        values = data[:, self.columns]
+        index = self._next_valid(values)
+        ready = int(np.sum(np.all(index < len(data), 1)))
+        out = data[:ready].copy()
+        out[:, self.columns] = np.take_along_axis(values, index[:ready], 0)
+        if ready:
+            self.last = out[-1, self.columns]
+        self.pending = data[ready:]
+        return out
+
+    def flush(self):
+        """Finishes the stream, filling the rest samples by the last valid values
+
+        :return: filled samples
+        :rtype: numpy.ndarray
+        """
+        if self.pending is None:
+            return np.empty((0, 0))
+        out = self.pending.copy()
+        values = out[:, self.columns]
+        last = np.full(len(self.columns), np.nan) if self.last is None else self.last.copy()
+        for j in range(len(self.columns)):
+            valid = np.flatnonzero(~np.isnan(values[:, j]))
+            if len(valid):
+                last[j] = values[valid[-1], j]
+        index = self._next_valid(values)
+        filled = np.take_along_axis(values, np.minimum(index, len(values) - 1), 0)
+        out[:, self.columns] = np.where(index < len(values), filled, last)
+        self.pending, self.last = None, None
+        return out
+
+
+class OnlineDetector:
+    def __init__(self, settings):
+        """Detects fixations and saccades by velocity threshold in the stream of samples given by small chunks.
+        Coordinates smoothing, velocity calculation and events marks smoothing are made as in Trajectory and
+        Detector.ivt, so events match the offline detection of the same recording.
+        Only the last samples of every sliding window are kept, so the memory does not grow with the stream length.
+        Missing coordinates are held until the next valid sample arrives if 'fillna' smoothing flag is set
+
+        :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
+        """
+        ValuesChecker.check_settings(settings)
+        self.settings = settings
+        self.t0 = None
+        self.previous_time = np.nan
+        self.group = 0
+        self.run = None
+        self.stages = self.build_coordinates_stages() + [self.kinematics] + self.build_marks_stages()
+
+    @property
+    def latency(self):
+        """Number of samples to be received before the sample gets its event mark"""
+        return sum(x.lag for x in self.stages if isinstance(x, WindowFilter))
+
+    def build_coordinates_stages(self):
+        smoothing = self.settings['smoothing']
+        velocity = self.settings['velocity']
+        stages = []
+        if smoothing is not None:
+            window = smoothing['window']
+            if smoothing['method'] == 'savgol':
+                coefs = savgol_coeffs(window, smoothing['order'], use='dot')
+                stages.append(WindowFilter(window, window // 2, lambda x, c=coefs: np.dot(x, c), [1, 2],
+                                           savgol_edge(smoothing['order'])))
+            else:
+                func = np.median if smoothing['method'] in ['med', 'median'] else np.mean
+                lag = (window - 1) // 2 if smoothing['center'] else 0
+                stages.append(WindowFilter(window, lag, lambda x: func(x, axis=-1), [1, 2]))
+            if smoothing['fillna']:
+                stages.append(BackFill([1, 2]))
+        stages.append(self.angular_coordinates)
+        if velocity['velocity_type'] == 'finite_difference':
+            stages.append(WindowFilter(2, 0, lambda x: x[..., 1] - x[..., 0], [1, 2]))
+        else:
+            coefs = savgol_coeffs(velocity['window'], 2, deriv=1, use='dot')
+            stages.append(WindowFilter(velocity['window'], velocity['window'] // 2, lambda x, c=coefs: np.dot(x, c),
+                                       [1, 2], savgol_edge(2, 1)))
+        return stages
+
+    def build_marks_stages(self):
+        return [WindowFilter(5, 2, lambda x: np.median(x, axis=-1), [1]), BackFill([1])]
+
+    def angular_coordinates(self, data):
+        """Converts [time, porx, pory] samples to [time, xAng, yAng]"""
+        common = self.settings['common']
+        d = common['distance']
+        wid, hei = common['size']
+        wpix, hpix = common['resolution']
+        refx, refy = (wid / 2, hei / 2) if common['reference_point'] is None else common['reference_point']
+        out = data.copy()
+        out[:, 1] = 180 / np.pi * np.arctan((data[:, 1] - refx) / (d * wpix / wid))
+        out[:, 2] = 180 / np.pi * np.arctan((data[:, 2] - refy) / (d * hpix / hei))
+        return out
+
+    def kinematics(self, data):
+        """Converts [time, xAng', yAng'] samples to [time, fixation flag]"""
+        if self.settings['velocity']['velocity_type'] == 'finite_difference':
+            dist = np.sqrt(np.nansum(data[:, 1:] ** 2, 1))
+        else:
+            dist = np.sqrt(data[:, 1] ** 2 + data[:, 2] ** 2)
+        time = data[:, 0]
+        dt = np.diff(np.concatenate([[self.previous_time], time]))
+        if len(time):
+            self.previous_time = time[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocity = dist / dt
+        velocity[~np.isfinite(velocity)] = 0
+        fixation = ~(velocity > self.settings['oculus']['velocity_threshold'])
+        return np.stack([time, fixation.astype(float)], 1)
+
+    def group_events(self, data):
+        """Collects runs of the same marks and returns finished events"""
+        events = []
+        for time, mark in data:
+            event = 'Fixation' if mark else 'Saccade'
+            if self.run is not None and self.run[0] == event:
+                self.run[2] = time
+                self.run[3] += 1
+                continue
+            if self.run is not None:
+                events.append(Event(self.group, *self.run))
+            self.group += 1
+            self.run = [event, time, time, 1]
+        return events
+
+    def _process(self, data, flush=False):
+        for stage in self.stages:
+            if isinstance(stage, (WindowFilter, BackFill)):
+                out = stage.push(data) if len(data) else data
+                if flush:
+                    tail = stage.flush()
+                    out = np.concatenate([out, tail]) if len(tail) else out
+                data = out
+            else:
+                data = stage(data)
+        events = self.group_events(data)
+        if flush and self.run is not None:
+            events.append(Event(self.group, *self.run))
+            self.run = None
+        return events
+
+    def push(self, time, porx, pory):
+        """Adds chunk of samples to the stream
+
+        :param time: timestamps of the samples
+        :param porx: x-coordinates of the point of regard
+        :param pory: y-coordinates of the point of regard
+        :return: finished events
+        :rtype: list of Event
+        """
+        data = np.stack([np.asarray(time, float), np.asarray(porx, float), np.asarray(pory, float)], 1)
+        if self.t0 is None and len(data):
+            self.t0 = data[0, 0]
+        if self.settings['common']['adjust_time'] and self.t0 is not None:
+            data[:, 0] -= self.t0
+        if self.settings['common']['normalized']:
+            data[:, 1:] *= np.array(self.settings['common']['resolution'])
+        return self._process(data)
+
+    def flush(self):
+        """Finishes the stream
+
+        :return: the rest events
+        :rtype: list of Event
+        """
+        return self._process(np.empty((0, 3)), flush=True)
@@ -0,0 +1,172 @@
+import copy
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from eyevents.utils import value_nbytes
+from eyevents.values_checker import ValuesChecker
+
+
+class StageCache:
+    # Returned by get for missing keys
+    MISSING = object()
+
+    def __init__(self, max_bytes=1 << 30, directory=None, max_disk_bytes=8 << 30):
+        """Keeps results of trajectory stages shared by trajectories, e.g. by runs of settings variants.
+        Keys are made of the stage settings and upstream stages keys, see Trajectory.stage_cache_key.
+        Results are kept in memory and optionally on disk, the least recently used ones are dropped
+        when total size of a tier exceeds its cap. Safe to use from threads, the disk tier is shared by processes
+
+        :param max_bytes: memory tier cap in bytes
+        :param directory: path to disk tier directory, created if missing, None for memory tier only
+        :param max_disk_bytes: disk tier cap in bytes
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.items = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Worker processes get empty memory tier and share the disk one
+        state = self.__dict__.copy()
+        state['items'] = OrderedDict()
+        state['nbytes'] = 0
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def hash(key):
+        """Returns file name of the key"""
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key, default=MISSING):
+        """Returns cached result of the key from memory or disk tier
+
+        :param key: stage key string
+        :param default: value to return for missing keys
+        :return: cached result or default
+        """
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key][0]
+        if self.directory is None:
+            return default
+        path = os.path.join(self.directory, self.hash(key) + '.pkl')
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if stored_key != key:
+            return default
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """Saves result of the key to memory tier and to disk tier if it is set"""
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.directory, self.hash(key) + '.pkl'))
+        self._evict_disk()
+
+    def _remember(self, key, value):
+        size = value_nbytes(value)
+        with self.lock:
+            if key in self.items:
+                self.nbytes -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes and self.items:
+                _, (_, dropped) = self.items.popitem(last=False)
+                self.nbytes -= dropped
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(x[1] for x in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Removes all cached results from both tiers"""
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def override_settings(settings, overrides):
+    """Returns deep copy of settings with the values of nested overrides dictionary,
+    e.g. dict(oculus=dict(velocity_threshold=40))"""
+    result = copy.deepcopy(settings)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = override_settings(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def sweep(paths, settings, variants, stage='summary', stage_cache=None, trajectory_class=None, **kwargs):
+    """Calculates the stage of every trajectory for every settings variant.
+    Every file is loaded once, and only the stages depending on the changed settings are recalculated
+    for the next variant, e.g. only 'events' and 'summary' for velocity threshold variants.
+    Stage cache keeps other stages results between variants changing earlier stages
+
+    :param paths: list of trajectory files
+    :param settings: base settings in proper dictionary format
+    :param variants: list of nested dictionaries of settings overrides, see override_settings
+    :param stage: stage name, one of Trajectory.STAGES keys
+    :param stage_cache: StageCache to share stages results with, None for new memory cache
+    :param trajectory_class: Trajectory or its subclass, None for Trajectory
+    :param kwargs: additional trajectory_class keyword arguments
+    :return: list of dictionaries of trajectories names and stage results for every variant
+    :rtype: list
+    """
+    if trajectory_class is None:
+        from eyevents.trajectory import Trajectory
+        trajectory_class = Trajectory
+    if stage_cache is None:
+        stage_cache = StageCache()
+    variants_settings = [override_settings(settings, x) for x in variants]
+    for variant in variants_settings:
+        ValuesChecker.check_settings(variant)
+    results = [dict() for _ in variants]
+    for path in paths:
+        trajectory = trajectory_class(path, variants_settings[0], lazy=True, stage_cache=stage_cache, **kwargs)
+        for result, variant in zip(results, variants_settings):
+            trajectory.settings = variant
+            result[trajectory.name] = trajectory.get_stage(stage)
+    return results
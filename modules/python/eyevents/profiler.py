@@ -0,0 +1,152 @@
+import tracemalloc
+from timeit import default_timer
+
+import pandas as pd
+
+
+class Profiler:
+    def __init__(self, trace_memory=False):
+        """Records wall time, samples throughput and optionally peak allocated memory of the stages.
+        Stages are measured by the 'stage' context manager and may be nested
+
+        :param trace_memory: flag, measure peak memory allocated in the stages via tracemalloc.
+        It slows the stages down, so times are not reliable with it
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+
+    def child(self):
+        """Returns new empty profiler with the same settings, e.g. for one file processed in a worker process"""
+        return Profiler(self.trace_memory)
+
+    def extend(self, records):
+        """Adds records of another profiler"""
+        self.records.extend(records)
+
+    def stage(self, name, samples=None, **labels):
+        """Returns context manager measuring the stage. Its value is the stage record,
+        so 'samples' and labels can be set in it inside the stage
+
+        :param name: stage name
+        :param samples: number of processed samples, for throughput
+        :param labels: additional record fields, e.g. file name
+        :return: context manager
+        """
+        record = dict(stage=name, file=None, samples=samples)
+        record.update(labels)
+        return _Stage(self, record)
+
+    def _enter(self, record):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                record['_started'] = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+        record['_start'] = default_timer()
+
+    def _exit(self, record):
+        record['seconds'] = default_timer() - record.pop('_start')
+        if record['samples'] is not None and record['seconds'] > 0:
+            record['samples_per_second'] = record['samples'] / record['seconds']
+        if self.trace_memory:
+            start, peak = self._stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            record['peak_bytes'] = peak - start
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            if record.pop('_started', False):
+                tracemalloc.stop()
+        self.records.append(record)
+
+    def to_df(self):
+        """Returns all records as a table
+
+        :return: stage, file, samples, seconds, samples_per_second and peak_bytes columns for every record
+        :rtype: pandas.DataFrame
+        """
+        columns = ['stage', 'file', 'samples', 'seconds', 'samples_per_second']
+        if self.trace_memory:
+            columns.append('peak_bytes')
+        df = pd.DataFrame(self.records)
+        return df.reindex(columns=columns + [x for x in df.columns if x not in columns])
+
+    def summary(self):
+        """Returns records aggregated by stages
+
+        :return: number of calls, total and mean seconds, total samples, throughput and maximal peak of every stage
+        :rtype: pandas.DataFrame
+        """
+        df = self.to_df()
+        grouped = df.groupby('stage', sort=False)
+        summary = pd.DataFrame(dict(calls=grouped.size(),
+                                    seconds=grouped['seconds'].sum(),
+                                    mean_seconds=grouped['seconds'].mean(),
+                                    samples=grouped['samples'].sum(min_count=1)))
+        summary['samples_per_second'] = summary['samples'] / summary['seconds']
+        if self.trace_memory:
+            summary['peak_bytes'] = grouped['peak_bytes'].max()
+        return summary
+
+
+class _Stage:
+    __slots__ = ['profiler', 'record']
+
+    def __init__(self, profiler, record):
+        self.profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        self.profiler._enter(self.record)
+        return self.record
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.record)
+        return False
+
+
+class NullProfiler:
+    """Profiler doing nothing, used when instrumentation is disabled.
+    Its stages are one shared context manager, so they cost about a function call"""
+    trace_memory = False
+    records = ()
+
+    def __init__(self):
+        self._record = dict()
+
+    def __enter__(self):
+        return self._record
+
+    def __exit__(self, *exc):
+        return False
+
+    def child(self):
+        return self
+
+    def extend(self, records):
+        pass
+
+    def stage(self, name, samples=None, **labels):
+        return self
+
+
+null_profiler = NullProfiler()
+
+
+def progress_callback(callback):
+    """Makes progress consumer for 'progress' parameters of Trajectories and others from the callback
+
+    :param callback: function getting number of finished items and total number of items
+    :return: progress consumer wrapping results iterator as tqdm does
+    """
+    def progress(iterable, total=None):
+        done = 0
+        for item in iterable:
+            done += 1
+            callback(done, total)
+            yield item
+    return progress
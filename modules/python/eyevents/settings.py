@@ -43,7 +43,10 @@ settings = dict(
     ),
     # contains oculomotor events detectors settings
     oculus=dict(
-        method='IVT',  # chosen detection method
+        method='IVT',  # chosen detection method, one of [IVT, IDT, ANH]
         velocity_threshold=30,  # velocity threshold for IVT detector, in angular degrees
+        dispersion_threshold=1.5,  # dispersion threshold for IDT detector, in angular degrees
+        duration_threshold=0.1,  # minimal fixation duration for IDT detector, in time column units
+        initial_threshold=100,  # initial peak velocity threshold for ANH detector, not necessary
     )
 )
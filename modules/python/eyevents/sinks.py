@@ -0,0 +1,127 @@
+import pandas as pd
+
+from eyevents.aggregates import SaccadeAggregate, FixationAggregate
+
+
+class CsvSink:
+    def __init__(self, path, field='saccades', **kwargs):
+        """Appends a data frame of every trajectory result to the csv file, so rows of all files, e.g.
+        Trajectories.all_saccades, are collected on disk instead of memory. The file is rewritten on the first write
+
+        :param path: path to csv file
+        :param field: TrajectoryResult field to write: 'saccades', 'fixations', 'total_saccades' or 'total_fixations'
+        :param kwargs: additional pandas.DataFrame.to_csv parameters
+        """
+        self.path = path
+        self.field = field
+        self.kwargs = dict(index=False)
+        self.kwargs.update(kwargs)
+        self.file = None
+        self.columns = None
+
+    def write(self, result):
+        """Appends rows of the result
+
+        :param result: TrajectoryResult of the file
+        """
+        df = getattr(result, self.field)
+        if not isinstance(df, pd.DataFrame):
+            df = pd.DataFrame(df)
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='')
+            self.columns = list(df.columns)
+            df.to_csv(self.file, header=True, **self.kwargs)
+        else:
+            df.reindex(columns=self.columns).to_csv(self.file, header=False, **self.kwargs)
+        self.file.flush()
+
+    def close(self):
+        """Closes the file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ListSink:
+    def __init__(self, field='total_saccades'):
+        """Collects a data frame of every trajectory result in memory, for small per-file tables as totals
+
+        :param field: TrajectoryResult field to collect
+        """
+        self.field = field
+        self.items = []
+
+    def write(self, result):
+        """Keeps the field of the result
+
+        :param result: TrajectoryResult of the file
+        """
+        self.items.append(getattr(result, self.field))
+
+    def to_df(self):
+        """Returns collected data frames concatenated as Trajectories does
+
+        :rtype: pandas.DataFrame
+        """
+        return pd.concat(self.items, ignore_index=True)
+
+
+class AggregateSink:
+    def __init__(self, by=None, relative_accuracy=.01):
+        """Merges saccades and fixations of every trajectory result into aggregates of its group, so cohort totals
+        and quantiles are kept in memory independent of the number of events. Sinks of workers are combined by merge
+
+        :param by: function getting trajectory name and returning its group, e.g. subject, None for one group 'all'
+        :param relative_accuracy: relative error of quantile sketches
+        """
+        self.by = by
+        self.relative_accuracy = relative_accuracy
+        self.groups = dict()
+
+    def aggregates(self, group):
+        """Returns saccade and fixation aggregates of the group, created if missing"""
+        if group not in self.groups:
+            self.groups[group] = (SaccadeAggregate(self.relative_accuracy), FixationAggregate(self.relative_accuracy))
+        return self.groups[group]
+
+    @staticmethod
+    def recording_time(result):
+        """Returns maximal time of the result recording, restored from totals frequencies without data frame"""
+        if result.df is not None:
+            return max(result.df.time)
+        for totals in (result.total_saccades, result.total_fixations):
+            count, freq = totals['count'].iloc[0], totals['freq'].iloc[0]
+            if count > 0:
+                return count / freq
+        return 0.
+
+    def write(self, result):
+        """Adds events of the result to its group
+
+        :param result: TrajectoryResult of the file
+        """
+        saccades, fixations = self.aggregates(self.by(result.name) if self.by is not None else 'all')
+        time = self.recording_time(result)
+        saccades.merge(SaccadeAggregate(self.relative_accuracy).update(result.saccades, time))
+        fixations.merge(FixationAggregate(self.relative_accuracy).update(result.fixations, time))
+
+    def merge(self, other):
+        """Adds groups of another sink, e.g. of a worker"""
+        for group, (saccades, fixations) in other.groups.items():
+            own_saccades, own_fixations = self.aggregates(group)
+            own_saccades.merge(saccades)
+            own_fixations.merge(fixations)
+        return self
+
+    def to_df(self, field='saccades'):
+        """Returns totals of every group in the format of Trajectories.total_saccades or total_fixations,
+        with group in 'code' column
+
+        :param field: 'saccades' or 'fixations'
+        :rtype: pandas.DataFrame
+        """
+        index = 0 if field == 'saccades' else 1
+        totals = [aggregates[index].totals(group) for group, aggregates in self.groups.items()]
+        if not totals:
+            return pd.DataFrame()
+        return pd.concat(totals, ignore_index=True)
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 
-from eyevents.utils import geron, graham_scan
+from eyevents.utils import convex_hull_areas
 
 
 class Summariser:
@@ -63,40 +63,104 @@ class Summariser:
     @staticmethod
     def saccade_params(df, code=None, mark='Saccade'):
         """Performs calculation of basic saccades characteristics."""
-        df = df[df.event == mark].copy()
-        groups = df.groupby('group')
-        sac_params_funcs = [
-            'nsamples',
-            'duration',
-            'amplitude',
-            'pathLength',
-            'curvature',
-            'peakVelocity',
-            'meanVelocity',
-            'massCenterXY',
-            'orientation'
-        ]
-        dfs = [groups.apply(getattr(Summariser, x)) for x in sac_params_funcs]
-        result = pd.concat(dfs, sort=False, axis=1)
+        groups, starts, lengths, cols = Summariser.events_arrays(df, mark, ['time', 'xAng', 'yAng', 'velAng'])
+        x, y = cols['xAng'], cols['yAng']
+        first, last = starts, starts + lengths - 1
+        short = lengths < 2
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            amplitude_x = np.where(short, np.nan, np.abs(x[first] - x[last]))
+            amplitude_y = np.where(short, np.nan, np.abs(y[first] - y[last]))
+            amplitude = np.sqrt(amplitude_x**2 + amplitude_y**2)
+
+            lines = np.zeros(len(x))
+            lines[:-1] = np.sqrt(np.diff(x)**2 + np.diff(y)**2)
+            lines[last] = 0
+            path_length = np.where(short, np.nan, Summariser.reduce_events(np.add, lines, starts))
+
+            curvature = path_length / amplitude
+            curvature[(amplitude == 0) | (path_length == 0)] = np.nan
+
+            d = (y[last] - y[first]) / (x[last] - x[first])
+            orientation = np.select([d >= 2, d <= .5], ['Vertical', 'Horisontal'], 'Diagonal').astype(object)
+
+        result = pd.DataFrame(dict(
+            nsamples=lengths,
+            duration=Summariser.events_duration(cols['time'], starts),
+            amplitudeX=amplitude_x,
+            amplitudeY=amplitude_y,
+            amplitude=amplitude,
+            pathLength=path_length,
+            curvature=curvature,
+            peakVelocity=Summariser.reduce_events(np.fmax, cols['velAng'], starts),
+            meanVelocity=Summariser.events_mean(cols['velAng'], starts),
+            centerX=Summariser.events_mean(x, starts),
+            centerY=Summariser.events_mean(y, starts),
+            orientation=orientation
+        ), index=pd.Index(groups, name='group'))
         result['code'] = code
         return result
 
     @staticmethod
     def fixation_params(df, code=None, mark='Fixation'):
         """Performs calculation of basic fixations characteristics."""
-        df = df[df.event == mark].copy()
-        groups = df.groupby('group')
-        fix_params_funcs = [
-            'nsamples',
-            'duration',
-            'massCenterXY',
-            'area'
-        ]
-        dfs = [groups.apply(getattr(Summariser, x)) for x in fix_params_funcs]
-        result = pd.concat(dfs, sort=False, axis=1)
+        groups, starts, lengths, cols = Summariser.events_arrays(df, mark, ['time', 'xAng', 'yAng'])
+        result = pd.DataFrame(dict(
+            nsamples=lengths,
+            duration=Summariser.events_duration(cols['time'], starts),
+            centerX=Summariser.events_mean(cols['xAng'], starts),
+            centerY=Summariser.events_mean(cols['yAng'], starts),
+            area=convex_hull_areas(cols['xAng'], cols['yAng'], np.repeat(groups, lengths))
+        ), index=pd.Index(groups, name='group'))
         result['code'] = code
         return result
 
+    @staticmethod
+    def events_arrays(df, mark, columns):
+        """Selects events with the given mark and splits them into contiguous runs of samples.
+        Events are ordered by group number, samples keep their order inside the event
+
+        :param df: events marked data frame with 'group' column
+        :param mark: mark of the events in the df
+        :param columns: names of the columns to extract
+        :returns: group numbers, start indices and lengths of the events, dictionary of column arrays
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, dict)
+        """
+        selected = (df.event == mark).values
+        groups = df['group'].values[selected]
+        order = None
+        if len(groups) > 1 and np.any(groups[1:] < groups[:-1]):
+            order = np.argsort(groups, kind='stable')
+            groups = groups[order]
+        cols = dict()
+        for col in columns:
+            values = df[col].values[selected].astype(float)
+            cols[col] = values if order is None else values[order]
+
+        starts = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]])) if len(groups) else np.empty(0, int)
+        lengths = np.diff(np.append(starts, len(groups)))
+        return groups[starts], starts, lengths, cols
+
+    @staticmethod
+    def reduce_events(ufunc, values, starts):
+        """Applies ufunc reduction to every event at once"""
+        if len(starts) == 0:
+            return np.empty(0)
+        return ufunc.reduceat(values, starts)
+
+    @staticmethod
+    def events_duration(time, starts):
+        """Calculates duration of every event. Any event."""
+        return Summariser.reduce_events(np.fmax, time, starts) - Summariser.reduce_events(np.fmin, time, starts)
+
+    @staticmethod
+    def events_mean(values, starts):
+        """Calculates mean of every event skipping missing values. Any event."""
+        valid = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (Summariser.reduce_events(np.add, np.where(valid, values, 0), starts) /
+                    Summariser.reduce_events(np.add, valid.astype(int), starts))
+
     @staticmethod
     def nsamples(df):
         """Calculates total samples of event. All events"""
@@ -186,15 +250,6 @@ class Summariser:
     @staticmethod
     def area(df):
         """Calculates the area covered by event points. Fixations only"""
-        if len(df) < 3:
-            return pd.Series(np.nan, index=['area'])
-        elif len(df) < 5:
-            pts = list(zip(df.xAng, df.yAng))
-        else:
-            pts = graham_scan(list(zip(df.xAng, df.yAng)))
-        area = 0
-        df = pd.DataFrame(pts, columns=['x', 'y'])
-        for i in range(1, len(pts)-1):
-            area += geron(df.iloc[[0, i, i+1]].x.tolist(), df.iloc[[0, i, i+1]].y.tolist())
-        result = pd.Series(area, index=['area'])
+        area = convex_hull_areas(df.xAng.values, df.yAng.values, np.zeros(len(df)))
+        result = pd.Series(area[0] if len(area) else np.nan, index=['area'])
         return result
@@ -1,61 +1,289 @@
 import numpy as np
 import pandas as pd
-from os import listdir
+from scipy import sparse
+from os import listdir, cpu_count
+from itertools import repeat
+from collections import deque, namedtuple
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 from eyevents.trajectory import Trajectory
 from eyevents.detector import Detector
-from eyevents.summariser import Summariser
+from eyevents.heatmaps import Heatmap
+from eyevents.pipeline import StageCache
+from eyevents.profiler import null_profiler
 from eyevents.utils import get_shortname
 
-from tqdm import tqdm_notebook
+from tqdm.auto import tqdm
+
+
+TrajectoryResult = namedtuple('TrajectoryResult', ['name', 'df', 'saccades', 'total_saccades',
+                                                   'fixations', 'total_fixations', 'transition_count', 'entropy',
+                                                   'profile'])
+
+
+def process_trajectory(trajectory_class, path, settings, *args, profiler=None, **kwargs):
+    """Builds trajectory of the file, detects its events and summarises them.
+    Module-level function, so it can be sent to worker processes
+
+    :param trajectory_class: Trajectory or its subclass
+    :param path: path to trajectory file
+    :param settings: settings in proper dictionary format
+    :param args: additional trajectory_class arguments
+    :param profiler: eyevents.profiler.Profiler, the file stages are measured by its child kept as trajectory profiler
+    :param kwargs: additional trajectory_class keyword arguments
+    :returns: trajectory, detected events data frame, saccades and fixations parameters
+    :rtype: (Trajectory, pandas.DataFrame, tuple, tuple)
+    """
+    profiler = null_profiler if profiler is None else profiler.child()
+    trajectory = trajectory_class(path, settings, *args, profiler=profiler, **kwargs)
+    buf_sac, buf_fix = trajectory.summary
+    return trajectory, trajectory.events, buf_sac, buf_fix
+
+
+def process_result(trajectory_class, path, settings, *args, keep_df=True, **kwargs):
+    """Processes the file as process_trajectory does, but returns only its results without trajectory object,
+    so nothing but them is kept or sent back from worker processes
+
+    :param trajectory_class: Trajectory or its subclass
+    :param path: path to trajectory file
+    :param settings: settings in proper dictionary format
+    :param args: additional trajectory_class arguments
+    :param keep_df: flag, return detected events data frame, otherwise it is None
+    :param kwargs: additional trajectory_class keyword arguments
+    :return: results of the file
+    :rtype: TrajectoryResult
+    """
+    trajectory, detd_df, buf_sac, buf_fix = process_trajectory(trajectory_class, path, settings, *args, **kwargs)
+    return TrajectoryResult(trajectory.name, detd_df if keep_df else None, buf_sac[0], buf_sac[1],
+                            buf_fix[0], buf_fix[1], trajectory.transition_count, trajectory.entropy,
+                            list(trajectory.profiler.records))
+
+
+def imap_trajectories(func, *iterables, n_jobs=None, executor=None, progress=None, prefetch=None):
+    """Lazily applies func to the arguments serially or in worker processes. Results keep the order of the arguments.
+    At most 'prefetch' tasks are submitted ahead of the consumed result, so unconsumed results do not pile up
+
+    :param func: module-level function to apply
+    :param iterables: iterables of func arguments
+    :param n_jobs: number of worker processes, None or 1 for serial run, -1 for all processors
+    :param executor: concurrent.futures.Executor to use instead of creating process pool
+    :param progress: progress consumer wrapping results iterator as tqdm does, None for tqdm, False to disable
+    :param prefetch: number of tasks submitted ahead, None for twice the number of workers
+    :return: iterator of results
+    :rtype: iterator
+    """
+    args = [list(x) for x in iterables]
+    total = len(args[0]) if args else 0
+    if progress is None:
+        progress = tqdm
+    if progress is False:
+        progress = lambda x, total=None: x
+
+    def results():
+        if executor is None and (n_jobs is None or n_jobs == 1):
+            yield from map(func, *args)
+            return
+        workers = cpu_count() if n_jobs is None or n_jobs == -1 else n_jobs
+        pool = executor if executor is not None else ProcessPoolExecutor(max_workers=workers)
+        window = prefetch or 2 * getattr(pool, '_max_workers', workers)
+        tasks = zip(*args)
+        futures = deque()
+        try:
+            for task in tasks:
+                futures.append(pool.submit(func, *task))
+                if len(futures) >= window:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+            if executor is None:
+                pool.shutdown()
+
+    return iter(progress(results(), total=total))
+
+
+def map_trajectories(func, *iterables, n_jobs=None, executor=None, progress=None):
+    """Applies func to the arguments serially or in worker processes. Results keep the order of the arguments
+
+    :param func: module-level function to apply
+    :param iterables: iterables of func arguments
+    :param n_jobs: number of worker processes, None or 1 for serial run, -1 for all processors
+    :param executor: concurrent.futures.Executor to use instead of creating process pool
+    :param progress: progress consumer wrapping results iterator as tqdm does, None for tqdm, False to disable
+    :return: list of results
+    :rtype: list
+    """
+    args = [list(x) for x in iterables]
+    prefetch = max(len(args[0]) if args else 0, 1)
+    return list(imap_trajectories(func, *args, n_jobs=n_jobs, executor=executor, progress=progress,
+                                  prefetch=prefetch))
 
 
 class Trajectories:
-    def __init__(self, directory, settings=None):
+    def __init__(self, directory, settings=None, n_jobs=None, executor=None, progress=None,
+                 chunk_size=None, log_likelihood_path=None, cache=None, compact=False, drop_columns=None,
+                 profiler=None, sparse=False, stage_cache=None, likelihood_path=None):
         """Contains trajectories with events and their parameters.
 
         :param directory: path to trajectory files in the same format
         :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
+        :param n_jobs: number of worker processes to build trajectories, None for serial run, -1 for all processors
+        :param executor: concurrent.futures.Executor to build trajectories with instead of process pool
+        :param progress: progress consumer wrapping results iterator as tqdm does, None for tqdm, False to disable
+        :param chunk_size: number of rows of likelihood matrices calculated at once, None for all rows
+        :param log_likelihood_path: path to .npy file to keep log-likelihood matrix as memory map, None to keep in memory
+        :param cache: RecordingCache or path to its directory to keep parsed files in, None to parse every time
+        :param compact: flag, keep kinematics as float32, events marks as categorical and release intermediate stages
+        :param drop_columns: columns to drop from trajectories df in compact mode, e.g. Trajectory.INTERMEDIATE_COLUMNS
+        :param profiler: eyevents.profiler.Profiler collecting stages measures of all files, None to skip measuring.
+        Its records are kept in profiler attribute, see its to_df and summary methods
+        :param sparse: flag, keep transition matrices and their stacks as scipy.sparse.csr_matrix for fine AOI grids
+        :param stage_cache: eyevents.pipeline.StageCache or path to its disk tier directory to take stages results
+        from, e.g. when the directory is processed with several settings variants. Worker processes share disk tier only
+        :param likelihood_path: path to .npy file to keep likelihood matrix as memory map, None to keep in memory
         """
         if directory[-1] not in ['/', '\\']:
             directory += '/'
         files = [directory + x for x in listdir(directory)]
         shortnames = [get_shortname(x) for x in files]
-        self.trajectories = {get_shortname(x): Trajectory(x, settings) for x in files}
+        self.profiler = null_profiler if profiler is None else profiler
+        if isinstance(stage_cache, str):
+            stage_cache = StageCache(directory=stage_cache)
+        results = map_trajectories(partial(process_trajectory, cache=cache, compact=compact,
+                                           drop_columns=drop_columns, profiler=profiler, sparse=sparse,
+                                           stage_cache=stage_cache),
+                                   repeat(Trajectory, len(files)), files,
+                                   repeat(settings, len(files)),
+                                   n_jobs=n_jobs, executor=executor, progress=progress)
+        self.trajectories = {}
         self.dfs = {}
         all_saccades = []
         total_saccades = []
         all_fixations = []
         total_fixations = []
-        for key, val in tqdm_notebook(self.trajectories.items()):
-            detd_df = Detector.ivt(val.df, settings)
-            buf_sac = Summariser.total_saccade_params(detd_df, val.name)
-            buf_fix = Summariser.total_fixation_params(detd_df, val.name)
+        for trajectory, detd_df, buf_sac, buf_fix in results:
             all_saccades.append(buf_sac[0])
             total_saccades.append(buf_sac[1])
             all_fixations.append(buf_fix[0])
             total_fixations.append(buf_fix[1])
-            self.dfs[key] = detd_df
+            self.trajectories[trajectory.name] = trajectory
+            self.dfs[trajectory.name] = detd_df
+            self.profiler.extend(trajectory.profiler.records)
 
         self.all_saccades = pd.concat(all_saccades, ignore_index=True)
         self.total_saccades = pd.concat(total_saccades, ignore_index=True)
         self.all_fixations = pd.concat(all_fixations, ignore_index=True)
         self.total_fixations = pd.concat(total_fixations, ignore_index=True)
 
-        likelihoods_mask = pd.DataFrame(np.zeros((len(files), len(files))), columns=shortnames, index=shortnames)
-        self.df_likelihood = likelihoods_mask.copy()
-        self.df_log_likelihood = likelihoods_mask.copy()
-        for row in shortnames:
-            for col in shortnames:
-                transitions = self.trajectories[row].transition_count
-                probabilities = self.trajectories[col].transition_probability
-                log_probabilities = self.trajectories[col].transition_log_probability
-                self.df_likelihood.loc[row, col] = Trajectories.get_likelihood(transitions, probabilities)
-                self.df_log_likelihood.loc[row, col] = Trajectories.get_log_likelihood(transitions, log_probabilities)
+        with self.profiler.stage('Trajectories.stack_transitions'):
+            counts, probabilities, log_probabilities = Trajectories.stack_transitions(
+                [self.trajectories[x] for x in shortnames])
+        with self.profiler.stage('Trajectories.get_likelihoods'):
+            likelihoods = Trajectories.get_likelihoods(counts, probabilities, chunk_size, likelihood_path)
+        with self.profiler.stage('Trajectories.get_log_likelihoods'):
+            log_likelihoods = Trajectories.get_log_likelihoods(counts, log_probabilities, chunk_size,
+                                                               log_likelihood_path)
+        # Stacks are as large as the trajectories transition matrices together, they are not kept
+        del counts, probabilities, log_probabilities
+        self.df_likelihood = pd.DataFrame(likelihoods, columns=shortnames, index=shortnames)
+        self.df_log_likelihood = pd.DataFrame(log_likelihoods, columns=shortnames, index=shortnames)
 
         self.df_entropies = pd.DataFrame([self.trajectories[x].entropy for x in shortnames],
                                          columns=['Entropy'], index=shortnames)
 
+    @staticmethod
+    def iterate(directory, settings=None, sinks=(), keep_df=True, n_jobs=None, executor=None, progress=None,
+                prefetch=None, cache=None, compact=False, drop_columns=None, profiler=None, sparse=False,
+                stage_cache=None):
+        """Processes trajectory files one by one without keeping them, for directories too big to hold in memory.
+        Only the results of the yielded file and of the files being processed in workers are kept at once
+
+        :param directory: path to trajectory files in the same format
+        :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
+        :param sinks: objects with 'write' method getting every TrajectoryResult, e.g. eyevents.sinks.CsvSink.
+        Sinks having 'close' method are closed when the iteration ends
+        :param keep_df: flag, yield detected events data frames, otherwise 'df' field of the results is None
+        :param n_jobs: number of worker processes to build trajectories, None for serial run, -1 for all processors
+        :param executor: concurrent.futures.Executor to build trajectories with instead of process pool
+        :param progress: progress consumer wrapping results iterator as tqdm does, None for tqdm, False to disable
+        :param prefetch: number of files processed ahead in workers, None for twice the number of workers
+        :param cache: RecordingCache or path to its directory to keep parsed files in, None to parse every time
+        :param compact: flag, keep kinematics as float32, events marks as categorical and release intermediate stages
+        :param drop_columns: columns to drop from trajectories df in compact mode, e.g. Trajectory.INTERMEDIATE_COLUMNS
+        :param profiler: eyevents.profiler.Profiler collecting stages measures of all files, None to skip measuring.
+        Measures of every file are also yielded in 'profile' field of its result
+        :param sparse: flag, keep transition matrices as scipy.sparse.csr_matrix for fine AOI grids
+        :param stage_cache: eyevents.pipeline.StageCache or path to its disk tier directory to take stages results
+        from, e.g. when the directory is processed with several settings variants. Worker processes share disk tier only
+        :return: iterator of results of the files in directory listing order
+        :rtype: iterator of TrajectoryResult
+        """
+        if directory[-1] not in ['/', '\\']:
+            directory += '/'
+        files = [directory + x for x in listdir(directory)]
+        if isinstance(stage_cache, str):
+            stage_cache = StageCache(directory=stage_cache)
+        results = imap_trajectories(partial(process_result, keep_df=keep_df, cache=cache, compact=compact,
+                                            drop_columns=drop_columns, profiler=profiler, sparse=sparse,
+                                            stage_cache=stage_cache),
+                                    repeat(Trajectory, len(files)), files,
+                                    repeat(settings, len(files)),
+                                    n_jobs=n_jobs, executor=executor, progress=progress, prefetch=prefetch)
+        try:
+            for result in results:
+                if profiler is not None:
+                    profiler.extend(result.profile)
+                for sink in sinks:
+                    sink.write(result)
+                yield result
+        finally:
+            for sink in sinks:
+                if hasattr(sink, 'close'):
+                    sink.close()
+
+    def get_grid_entropies(self, grids):
+        """Calculates entropies of all trajectories for several AOI grids in one pass over every trajectory,
+        see Trajectory.get_grid_pyramid
+
+        :param grids: list of cells for x and y coordinates, e.g. [[3, 3], [5, 5], [15, 15]]
+        :return: entropies with trajectories names as index and grids as columns
+        :rtype: pandas.DataFrame
+        """
+        columns = ['{}x{}'.format(*g) for g in grids]
+        rows = dict()
+        for name, trajectory in self.trajectories.items():
+            pyramid = trajectory.get_grid_pyramid(grids)
+            rows[name] = [pyramid[tuple(g)]['entropy'] for g in grids]
+        return pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+
+    def get_threshold_sweep(self, thresholds, window=5):
+        """Summarises events of all trajectories for several velocity thresholds, see Detector.ivt_sweep
+
+        :param thresholds: velocity thresholds, in angular degrees
+        :param window: window of marks smoothing
+        :return: events totals with trajectories names and thresholds as index
+        :rtype: pandas.DataFrame
+        """
+        return pd.concat({name: Detector.ivt_sweep(trajectory.df, thresholds, window)
+                          for name, trajectory in self.trajectories.items()}, names=['name'])
+
+    def get_heatmaps(self, groups=None, bin_size=1, weights='duration', normalize=True):
+        """Builds fixation heatmaps of trajectories or of their groups, see Heatmap.group_heatmaps
+
+        :param groups: dictionary of trajectory names and their groups, None for a map of every trajectory
+        :param bin_size: bin side in pixels
+        :param weights: column of fixations weights, e.g. 'duration', None for counts
+        :param normalize: flag, trajectories count equally in groups
+        :return: dictionary of groups and their eyevents.heatmaps.Heatmap
+        :rtype: dict
+        """
+        settings = next(iter(self.trajectories.values())).settings
+        return Heatmap.group_heatmaps(self.all_fixations, settings, groups=groups, bin_size=bin_size,
+                                      weights=weights, normalize=normalize)
+
     @staticmethod
     def get_likelihood(transitions, probabilities):
         return np.product(transitions * probabilities)
@@ -63,3 +291,107 @@ class Trajectories:
     @staticmethod
     def get_log_likelihood(transitions, log_probabilities):
         return np.sum(transitions * log_probabilities)
+
+    def memory_usage(self):
+        """Returns memory used by every trajectory: its calculated stages and events columns of detected data frame.
+        Other columns of detected data frames share memory with trajectories df
+
+        :return: bytes of every stage, events columns and total for every trajectory
+        :rtype: pandas.DataFrame
+        """
+        usage = pd.DataFrame({x: y.memory_usage() for x, y in self.trajectories.items()}).T.fillna(0).astype(np.int64)
+        usage['events'] = [self.dfs[x][['event', 'group']].memory_usage(deep=True, index=False).sum()
+                           for x in usage.index]
+        usage['total'] = usage.sum(1)
+        return usage
+
+    @staticmethod
+    def stack_transitions(trajectories):
+        """Stacks flattened transition matrices of trajectories. Sparse matrices are stacked to sparse ones
+
+        :param trajectories: list of trajectories
+        :returns: transition counts, probabilities and log-probabilities, each of (len(trajectories), cells**2) shape
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray) or (scipy.sparse.csr_matrix, ...)
+        """
+        stacks = []
+        for name in ['transition_count', 'transition_probability', 'transition_log_probability']:
+            matrices = [getattr(x, name) for x in trajectories]
+            if matrices and sparse.issparse(matrices[0]):
+                stacks.append(sparse.vstack([x.reshape(1, -1) for x in matrices], format='csr'))
+            else:
+                stacks.append(np.stack([x.ravel() for x in matrices]))
+        return tuple(stacks)
+
+    @staticmethod
+    def get_likelihoods(counts, probabilities, chunk_size=None, out=None):
+        """Batched get_likelihood for every pair of counts and probabilities rows.
+        Products are found as exponents of sums of logarithms, so they are zero if any factor is zero
+        and do not underflow on the way
+
+        :param counts: stack of flattened transition counts, dense or sparse
+        :param probabilities: stack of flattened transition probabilities, dense or sparse
+        :param chunk_size: number of rows calculated at once, None for all rows
+        :param out: array or path to .npy file to write result to as memory map, None for new array
+        :return: matrix of (len(counts), len(probabilities)) shape
+        :rtype: numpy.ndarray
+        """
+        log_counts = Trajectories._log_products(counts)
+        log_probabilities = Trajectories._log_products(probabilities)
+        out = Trajectories._prepare_out(out, (counts.shape[0], probabilities.shape[0]))
+        step = chunk_size or max(counts.shape[0], 1)
+        for start in range(0, counts.shape[0], step):
+            out[start:start + step] = np.exp(log_counts[start:start + step, None] + log_probabilities[None, :])
+        return out
+
+    @staticmethod
+    def _log_products(stack):
+        """Returns logarithms of rows products, -inf for rows with zeros"""
+        if sparse.issparse(stack):
+            stack = stack.tocsr()
+            logs = stack.copy()
+            logs.data = np.log(logs.data)
+            full = (stack.getnnz(1) == stack.shape[1]) & (np.minimum.reduceat(np.append(stack.data, 1),
+                                                                               stack.indptr[:-1]) > 0)
+            return np.where(full, np.asarray(logs.sum(1)).ravel(), -np.inf)
+        with np.errstate(divide='ignore'):
+            return np.where(np.all(stack > 0, 1), np.sum(np.log(stack), 1), -np.inf)
+
+    @staticmethod
+    def get_log_likelihoods(counts, log_probabilities, chunk_size=None, out=None, fill=Trajectory.LOG_PROBABILITY_FILL):
+        """Batched get_log_likelihood for every pair of counts and log-probabilities rows as one matrix product.
+        For sparse log-probabilities missing elements are 'fill', so the result equals the dense one:
+        counts @ L.T + fill * (counts.sum - counts @ M.T), where M is the sparsity pattern of L
+
+        :param counts: stack of flattened transition counts, dense or sparse
+        :param log_probabilities: stack of flattened transition log-probabilities, dense or sparse
+        :param chunk_size: number of rows calculated at once, None for all rows
+        :param out: array or path to .npy file to write result to as memory map, None for new array
+        :param fill: log-probability of missing elements of sparse log-probabilities
+        :return: matrix of (len(counts), len(log_probabilities)) shape
+        :rtype: numpy.ndarray
+        """
+        out = Trajectories._prepare_out(out, (counts.shape[0], log_probabilities.shape[0]))
+        step = chunk_size or max(counts.shape[0], 1)
+        if not sparse.issparse(log_probabilities):
+            for start in range(0, counts.shape[0], step):
+                out[start:start + step] = np.dot(counts[start:start + step], log_probabilities.T)
+            return out
+
+        counts = sparse.csr_matrix(counts)
+        log_probabilities = log_probabilities.tocsr()
+        pattern = log_probabilities.copy()
+        pattern.data = np.ones_like(pattern.data)
+        for start in range(0, counts.shape[0], step):
+            chunk = counts[start:start + step]
+            known = (chunk @ log_probabilities.T).toarray()
+            known_counts = (chunk @ pattern.T).toarray()
+            out[start:start + step] = known + fill * (np.asarray(chunk.sum(1)) - known_counts)
+        return out
+
+    @staticmethod
+    def _prepare_out(out, shape):
+        if out is None:
+            return np.empty(shape)
+        if isinstance(out, str):
+            return np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+        return out
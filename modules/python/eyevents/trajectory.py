@@ -1,60 +1,203 @@
+import copy
+import os
+
 import numpy as np
 import pandas as pd
 from scipy.signal import savgol_filter
 
 from eyevents.values_checker import ValuesChecker
-from eyevents.utils import get_shortname
+from eyevents.cache import RecordingCache, read_recording
+from eyevents.detector import Detector
+from eyevents.summariser import Summariser
+from eyevents.pipeline import StageCache
+from eyevents.profiler import null_profiler
+from eyevents.utils import value_nbytes, get_shortname, steps_mean, aoi_indices, transition_counts, sparse_transition_counts, \
+    transition_probabilities, transition_log_probabilities, transition_entropy, nested_cells, aggregate_transitions
+
+
+def stage_property(name):
+    """Makes property for the trajectory stage result, the stage is calculated on the first access
+    and recalculated when settings it depends on are changed"""
+    def getter(self):
+        return self.get_stage(name)
+
+    def setter(self, value):
+        self._stages[name] = (self.stage_key(name), value)
+
+    return property(getter, setter, doc='Result of the {} stage'.format(name))
 
 
 class Trajectory:
-    def __init__(self, path, settings):
+    # Pipeline stages: method calculating the stage, previous stages and settings paths the stage depends on.
+    # Results read outside the pipeline are kept in compact mode, only intermediate stages are released
+    STAGES = dict(
+        raw_df=dict(method='get_trajectory_as_df', upstream=[],
+                    settings=[('loading',), ('columns',), ('common', 'adjust_time'), ('common', 'normalized'),
+                              ('common', 'resolution')]),
+        smoothed_df=dict(method='smooth_trajectory_df', upstream=['raw_df'],
+                         settings=[('smoothing',)]),
+        df=dict(method='calculate_angular_parameters', upstream=['smoothed_df'],
+                settings=[('common', 'distance'), ('common', 'size'), ('common', 'resolution'),
+                          ('common', 'reference_point'), ('velocity',)], keep=True),
+        events=dict(method='detect_events', upstream=['df'],
+                    settings=[('oculus',)], keep=True),
+        summary=dict(method='summarise_events', upstream=['events'],
+                     settings=[], keep=True),
+        step_points=dict(method='calculate_step_points', upstream=['smoothed_df'],
+                         settings=[('common', 'samples_for_step')], keep=True),
+        aois_sequence=dict(method='calculate_aois', upstream=['step_points'],
+                           settings=[('common', 'aois_grid'), ('common', 'resolution')]),
+        transition_count=dict(method='get_transition_matrix', upstream=['aois_sequence'],
+                              settings=[('common', 'aois_grid')], keep=True),
+        transition_probability=dict(method='get_transition_probabilities', upstream=['transition_count'],
+                                    settings=[], keep=True),
+        transition_log_probability=dict(method='get_transition_log_probabilities', upstream=['transition_probability'],
+                                        settings=[], keep=True),
+    )
+
+    raw_df = stage_property('raw_df')
+    smoothed_df = stage_property('smoothed_df')
+    df = stage_property('df')
+    events = stage_property('events')
+    summary = stage_property('summary')
+    step_points = stage_property('step_points')
+    aois_sequence = stage_property('aois_sequence')
+    transition_count = stage_property('transition_count')
+    transition_probability = stage_property('transition_probability')
+    transition_log_probability = stage_property('transition_log_probability')
+
+    # Intermediate columns of the kinematics stage, which are not used by detectors and summariser
+    INTERMEDIATE_COLUMNS = ['dt', 'distAng', 'accelAng']
+    # Columns of the kinematics stage read by detectors, summariser and extended trajectories, never dropped
+    REQUIRED_COLUMNS = ['time', 'porx', 'pory', 'xAng', 'yAng', 'velAng']
+    # Log-probability of transitions which never happened
+    LOG_PROBABILITY_FILL = -10
+
+    def __init__(self, path, settings, lazy=False, cache=None, compact=False, drop_columns=None, profiler=None,
+                 sparse=False, stage_cache=None):
         """Contains one trajectory values and additional parameters (velocities etc.)
 
         :param path: path to trajectory file
         :param settings: settings in proper dictionary format. You can use 'eyevent.utils.help' to see format
+        :param lazy: flag, calculate every stage on the first access instead of calculating all of them at once
+        :param cache: RecordingCache or path to its directory to keep parsed files in, None to parse every time
+        :param compact: flag, keep kinematics as float32 and release intermediate stages once next stages are calculated
+        :param drop_columns: columns to drop from df in compact mode, e.g. Trajectory.INTERMEDIATE_COLUMNS,
+        but not Trajectory.REQUIRED_COLUMNS
+        :param profiler: eyevents.profiler.Profiler to measure the stages with, None to skip measuring
+        :param sparse: flag, keep transition matrices as scipy.sparse.csr_matrix for fine AOI grids.
+        Log-probabilities keep only the transitions which happened, others are LOG_PROBABILITY_FILL
+        :param stage_cache: eyevents.pipeline.StageCache or path to its disk tier directory to share stages results
+        with other trajectories of the same file, e.g. in settings sweeps, None to calculate all stages
         """
         ValuesChecker.check_settings(settings)
-        self.settings = settings.copy()
+        self.settings = copy.deepcopy(settings)
         self.path = path
         self.name = get_shortname(path)
-        self.raw_df = None
-        self.df = None
-        self.aois_sequence = None
-        self.transition_count = None
-        self.transition_probability = None
-        self.transition_log_probability = None
-        self.get_trajectory_as_df()
-        self.smooth_trajectory_df()
-        self.calculate_angular_parameters()
-        self.calculate_aois()
-        self.get_transition_matrix()
-        self.get_transition_probabilities()
-        self.get_transition_log_probabilities()
+        self.cache = RecordingCache(cache) if isinstance(cache, str) else cache
+        self.compact = compact
+        self.drop_columns = drop_columns or []
+        required = [x for x in self.drop_columns if x in self.REQUIRED_COLUMNS]
+        if required:
+            raise ValueError('Columns {} can not be dropped, they are used by next stages.'.format(required))
+        self.profiler = null_profiler if profiler is None else profiler
+        self.sparse = sparse
+        self.stage_cache = StageCache(directory=stage_cache) if isinstance(stage_cache, str) else stage_cache
+        self.nsamples = None
+        self._stages = dict()
+        if not lazy:
+            for stage in self.STAGES:
+                self.get_stage(stage)
 
     @property
     def entropy(self):
-        return -np.sum(self.transition_probability * self.transition_log_probability)
+        return transition_entropy(self.transition_probability, self.transition_log_probability)
+
+    def stage_key(self, name):
+        """Returns key of the stage made of the settings the stage and all previous stages depend on"""
+        stage = self.STAGES[name]
+        values = []
+        for path in stage['settings']:
+            value = self.settings
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            values.append(value)
+        return repr((name, values, [self.stage_key(x) for x in stage['upstream']]))
+
+    def stage_cache_key(self, name):
+        """Returns key of the stage result in the stage cache: the file, the stage key and the flags changing results"""
+        stat = os.stat(self.path)
+        return repr((os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns, self.stage_key(name),
+                     self.compact, self.drop_columns, self.sparse))
+
+    def get_stage(self, name):
+        """Returns result of the stage, calculates it if it is missing or outdated.
+        Results of other trajectories of the same file are taken from the stage cache if it is set
+
+        :param name: stage name, one of Trajectory.STAGES keys
+        :return: stage result
+        """
+        key = self.stage_key(name)
+        cached = self._stages.get(name)
+        if cached is None or cached[0] != key:
+            value = StageCache.MISSING
+            if self.stage_cache is not None:
+                cache_key = self.stage_cache_key(name)
+                value = self.stage_cache.get(cache_key)
+            if value is StageCache.MISSING:
+                method = self.STAGES[name]['method']
+                with self.profiler.stage(method, file=self.name) as record:
+                    getattr(self, method)()
+                    record['samples'] = self.nsamples
+                if self.stage_cache is not None:
+                    self.stage_cache.put(cache_key, self._stages[name][1])
+            else:
+                self._stages[name] = (key, value)
+            cached = self._stages[name]
+            if self.compact:
+                self.release_stages()
+        return cached[1]
+
+    def release_stages(self):
+        """Drops results of the intermediate stages, which are needed only for already calculated stages.
+        Stages marked 'keep' are never dropped. Dropped stages are recalculated if the settings of the next stages
+        are changed"""
+        for name, stage in self.STAGES.items():
+            for upstream in stage['upstream']:
+                if self.STAGES[upstream].get('keep'):
+                    continue
+                dependents = [x for x, y in self.STAGES.items() if upstream in y['upstream']]
+                if upstream in self._stages and all(self.is_calculated(x) for x in dependents):
+                    del self._stages[upstream]
+
+    def memory_usage(self):
+        """Returns memory used by the calculated stages results
+
+        :return: bytes of every calculated stage
+        :rtype: pandas.Series
+        """
+        usage = dict()
+        for name, (_, value) in self._stages.items():
+            usage[name] = value_nbytes(value)
+        return pd.Series(usage, dtype=np.int64)
+
+    def is_calculated(self, name):
+        """Checks if the stage result is calculated and up to date"""
+        cached = self._stages.get(name)
+        return cached is not None and cached[0] == self.stage_key(name)
 
     def get_trajectory_as_df(self):
-        """Loads path as csv data frame via pandas.read_csv with additional parameters from settings
+        """Loads path as csv data frame via pandas.read_csv with additional parameters from settings.
+        Parsed columns are taken from the cache if it is set
 
         :return: coordinates data frame
         :rtype: pandas.DataFrame
         """
-        reading_settings = self.settings['loading']
-        df = pd.read_csv(self.path, **reading_settings)
-
-        colnames = df.columns
-        columns = dict()
-        for a, b in self.settings['columns'].items():
-            if type(b) is int:
-                columns[colnames[b]] = a
-            else:
-                columns[b] = a
-
-        cols_to_select = list(self.settings['columns'].keys())
-
-        df = df.rename(columns=columns)
+        if self.cache is None:
+            df = read_recording(self.path, self.settings['loading'], self.settings['columns'])
+        else:
+            df = self.cache.read(self.path, self.settings['loading'], self.settings['columns'])
+        self.nsamples = len(df)
 
         if self.settings['common']['adjust_time']:
             min_t = np.min(df.loc[:, 'time'])
@@ -63,7 +206,7 @@ class Trajectory:
         if self.settings['common']['normalized']:
             df.loc[:, ['porx', 'pory']] = df.loc[:, ['porx', 'pory']] * np.array(self.settings['common']['resolution'])
 
-        self.raw_df = df[cols_to_select]
+        self.raw_df = df
 
     def smooth_trajectory_df(self):
         """Performs data frame coordinates smoothing with one of three (currently) methods:
@@ -76,9 +219,8 @@ class Trajectory:
         """
         df = self.raw_df.copy()
         if self.settings['smoothing'] is None:
-            return df
+            self.smoothed_df = df
         else:
-            df = df.copy()
             cols_to_smooth = df.drop('time', 1).columns
             if self.settings['smoothing']['method'] == 'savgol':
                 savgol = lambda x: savgol_filter(x,
@@ -96,7 +238,7 @@ class Trajectory:
             df.loc[:, cols_to_smooth] = windows
             if self.settings['smoothing']['fillna']:
                 df = df.fillna(method='bfill').fillna(method='ffill')
-            self.df = df
+            self.smoothed_df = df
 
     def calculate_angular_parameters(self):
         """Performs angular parameters calculation for input coordinates data frame
@@ -106,7 +248,7 @@ class Trajectory:
         :return: data frame with additional parameters
         :rtype: pandas.DataFrame
         """
-        df = self.df.copy()
+        df = self.smoothed_df.copy(deep=False)
         d = self.settings['common']['distance']
         wid, hei = self.settings['common']['size']
         wpix, hpix = self.settings['common']['resolution']
@@ -140,51 +282,76 @@ class Trajectory:
         df.loc[:, ['velAng', 'accelAng']] = df[['velAng', 'accelAng']].replace(to_replace=[np.nan, np.inf, -np.inf],
                                                                                value=0)
 
+        if self.compact:
+            df = df.drop(columns=[x for x in self.drop_columns if x in df.columns])
+            df = df.astype({x: np.float32 for x in df.columns if x != 'time' and df[x].dtype == np.float64})
         self.df = df
 
-    def calculate_aois(self):
-        df = self.df.copy()
+    def detect_events(self):
+        """Detects oculomotor events by the method set in settings oculus field, see Detector.detect"""
+        events = Detector.detect(self.df, self.settings)
+        if self.compact:
+            events = Detector.compact(events)
+        self.events = events
 
-        grid = self.settings['common']['aois_grid']
-        resolution = self.settings['common']['resolution']
-        samples_for_step = self.settings['common']['samples_for_step']
-        x_step = resolution[0] / grid[0]
-        y_step = resolution[1] / grid[1]
-        xs = np.concatenate([[-np.inf], np.arange(0, resolution[0] + x_step, x_step)])
-        ys = np.concatenate([[-np.inf], np.arange(0, resolution[1] + y_step, y_step)])
-
-        max_group = len(df) // samples_for_step + 1
-        df['t_group'] = np.repeat(np.arange(max_group), samples_for_step)[:len(df)]
-        df = df.groupby('t_group').agg({'porx':'mean', 'pory':'mean'})
-
-        def get_aoi(x):
-            x,y = x[0], x[1]
-            if x<0 or x>resolution[0] or y<0 or y>resolution[1]:
-                return grid[0]*grid[1]
-            else:
-                xp = sum(x > xs) - 1
-                yp = sum(y > ys) - 1
-                return (yp-1) * grid[0] + xp
+    def summarise_events(self):
+        """Calculates saccades and fixations parameters and their totals"""
+        self.summary = (Summariser.total_saccade_params(self.events, self.name),
+                        Summariser.total_fixation_params(self.events, self.name))
 
-        df['aoi'] = df.apply(get_aoi, axis=1)
+    def calculate_step_points(self):
+        """Averages coordinates over every samples_for_step samples"""
+        samples_for_step = self.settings['common']['samples_for_step']
+        self.step_points = (steps_mean(self.smoothed_df['porx'].values, samples_for_step),
+                            steps_mean(self.smoothed_df['pory'].values, samples_for_step))
 
-        self.aois_sequence = df.aoi.values
+    def calculate_aois(self):
+        """Finds AOI cell of every averaged point"""
+        grid = self.settings['common']['aois_grid']
+        resolution = self.settings['common']['resolution']
+        x, y = self.step_points
+        self.aois_sequence = aoi_indices(x, y, grid, resolution)
 
     def get_transition_matrix(self):
         grid = self.settings['common']['aois_grid']
-        matrix = np.zeros((grid[0]*grid[1]+1, grid[0]*grid[1]+1))
-        for _from, _to in zip(self.aois_sequence[:-1], self.aois_sequence[1:]):
-            matrix[_to][_from] += 1
-        self.transition_count = matrix
+        if self.sparse:
+            self.transition_count = sparse_transition_counts(self.aois_sequence, grid[0]*grid[1]+1)
+        else:
+            self.transition_count = transition_counts(self.aois_sequence, grid[0]*grid[1]+1)
 
     def get_transition_probabilities(self):
-        a = self.transition_count
-        b = np.sum(a, axis=0)
-        matrix = np.divide(a, b, out=np.zeros_like(a), where = b!=0)
-        self.transition_probability = matrix
+        self.transition_probability = transition_probabilities(self.transition_count)
 
     def get_transition_log_probabilities(self):
-        a = self.transition_probability
-        mask = np.ones_like(a) * -10
-        matrix = np.log(a, out=mask, where = a!=0)
-        self.transition_log_probability = matrix
+        self.transition_log_probability = transition_log_probabilities(self.transition_probability,
+                                                                       self.LOG_PROBABILITY_FILL)
+
+    def get_grid_pyramid(self, grids):
+        """Calculates transitions for several AOI grids from one sequence of averaged coordinates.
+        Grids are processed from the finest one, and counts of a grid nesting into an already processed finer grid
+        are summed from the counts of the finest of them instead of being found from coordinates
+
+        :param grids: list of cells for x and y coordinates, e.g. [[3, 3], [5, 5], [15, 15]]
+        :return: dictionary with grid tuples as keys and dictionaries of 'count', 'probability', 'log_probability'
+        and 'entropy' as values
+        :rtype: dict
+        """
+        resolution = self.settings['common']['resolution']
+        x, y = self.step_points
+
+        levels = dict()
+        for grid in sorted(set(tuple(g) for g in grids), key=lambda g: g[0] * g[1], reverse=True):
+            cells = grid[0] * grid[1] + 1
+            finer = [g for g in levels if nested_cells(g, grid) is not None]
+            if finer:
+                source = min(finer, key=lambda g: g[0] * g[1])
+                count = aggregate_transitions(levels[source]['count'], nested_cells(source, grid), cells)
+            elif self.sparse:
+                count = sparse_transition_counts(aoi_indices(x, y, grid, resolution), cells)
+            else:
+                count = transition_counts(aoi_indices(x, y, grid, resolution), cells)
+            probability = transition_probabilities(count)
+            log_probability = transition_log_probabilities(probability, self.LOG_PROBABILITY_FILL)
+            levels[grid] = dict(count=count, probability=probability, log_probability=log_probability,
+                                entropy=transition_entropy(probability, log_probability))
+        return {tuple(g): levels[tuple(g)] for g in grids}
@@ -1,6 +1,8 @@
 from random import randint
 from math import atan2
 import numpy as np
+import pandas as pd
+from scipy import sparse
 
 
 def help():
@@ -29,6 +31,276 @@ def geron(x, y):
     return result
 
 
+def value_nbytes(value):
+    """Returns memory used by the value: data frame, numpy array, sparse matrix or tuple or list of them"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if sparse.issparse(value):
+        value = value.tocsr()
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(value_nbytes(x) for x in value)
+    return getattr(value, 'nbytes', 0)
+
+
+def angular_to_pixels(x_ang, y_ang, settings):
+    """Converts angular coordinates back to screen pixels, inverse of Trajectory.calculate_angular_parameters
+
+    :param x_ang: x angular coordinates, in degrees
+    :param y_ang: y angular coordinates, in degrees
+    :param settings: settings dictionary with filled common field
+    :return: x and y pixel coordinates
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    d = settings['common']['distance']
+    wid, hei = settings['common']['size']
+    wpix, hpix = settings['common']['resolution']
+    if settings['common']['reference_point'] is None:
+        refx, refy = wid / 2, hei / 2
+    else:
+        refx, refy = settings['common']['reference_point']
+    x = refx + np.tan(np.asarray(x_ang, float) * np.pi / 180) * (d * wpix / wid)
+    y = refy + np.tan(np.asarray(y_ang, float) * np.pi / 180) * (d * hpix / hei)
+    return x, y
+
+
+def pixels_per_degree(settings):
+    """Returns numbers of x and y screen pixels in one angular degree near the reference point"""
+    d = settings['common']['distance']
+    wid, hei = settings['common']['size']
+    wpix, hpix = settings['common']['resolution']
+    step = np.tan(np.pi / 180) * d
+    return step * wpix / wid, step * hpix / hei
+
+
+def steps_mean(values, samples_for_step):
+    """Averages values over consecutive blocks of samples_for_step samples, missing values are skipped
+
+    :param values: one-dimensional array of values
+    :param samples_for_step: number of samples in one block
+    :return: mean value of every block
+    :rtype: numpy.ndarray
+    """
+    values = np.asarray(values, float)
+    steps = np.arange(len(values)) // samples_for_step
+    valid = ~np.isnan(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.bincount(steps, weights=np.where(valid, values, 0)) / np.bincount(steps, weights=valid)
+
+
+def aoi_indices(x, y, grid, resolution):
+    """Finds numbers of regular grid cells (AOIs) for the points.
+Cells are numbered row by row from the top-left corner of the screen starting with 0, a cell includes its right and
+bottom borders. Points outside of the screen and missing points get number grid[0] * grid[1].
+Arrays of any shape are accepted, e.g. a stack of trajectories.
+
+    :param x: x-coordinates of the points in pixels
+    :param y: y-coordinates of the points in pixels
+    :param grid: cells for x and y coordinates respectively
+    :param resolution: screen resolution in pixels
+    :return: cells numbers of the same shape as x
+    :rtype: numpy.ndarray
+    """
+    x, y = np.asarray(x, float), np.asarray(y, float)
+    xp = np.digitize(x, np.linspace(0, resolution[0], grid[0] + 1), right=True) - 1
+    yp = np.digitize(y, np.linspace(0, resolution[1], grid[1] + 1), right=True) - 1
+    aois = np.maximum(yp, 0) * grid[0] + np.maximum(xp, 0)
+    inside = (x >= 0) & (x <= resolution[0]) & (y >= 0) & (y <= resolution[1])
+    aois[~inside] = grid[0] * grid[1]
+    return aois
+
+
+def transition_counts(sequences, cells):
+    """Counts transitions between consecutive cells of sequences. Element [to][from] of the matrix is the number of
+transitions from cell 'from' to cell 'to'.
+
+    :param sequences: cells sequence, or two-dimensional array or list of cells sequences for a stack of trajectories
+    :param cells: total number of cells
+    :return: transition matrix of (cells, cells) shape, or stack of matrices of (len(sequences), cells, cells) shape
+    :rtype: numpy.ndarray
+    """
+    single = isinstance(sequences, np.ndarray) and sequences.ndim == 1
+    sequences = [np.asarray(sequences)] if single else [np.asarray(x) for x in sequences]
+    lengths = [len(x) for x in sequences]
+    flat = np.concatenate(sequences).astype(np.int64) if sequences else np.empty(0, np.int64)
+    owner = np.repeat(np.arange(len(sequences)), lengths)
+    same = owner[1:] == owner[:-1]
+    codes = (owner[:-1][same] * cells + flat[1:][same]) * cells + flat[:-1][same]
+    matrix = np.bincount(codes, minlength=len(sequences) * cells * cells).astype(float)
+    matrix = matrix.reshape(len(sequences), cells, cells)
+    return matrix[0] if single else matrix
+
+
+def sparse_transition_counts(sequence, cells):
+    """Sparse version of transition_counts for one cells sequence, for fine grids with mostly zero transitions.
+
+    :param sequence: cells sequence
+    :param cells: total number of cells
+    :return: transition matrix of (cells, cells) shape with summed duplicates
+    :rtype: scipy.sparse.csr_matrix
+    """
+    sequence = np.asarray(sequence, np.int64)
+    matrix = sparse.coo_matrix((np.ones(max(len(sequence) - 1, 0)), (sequence[1:], sequence[:-1])),
+                               shape=(cells, cells)).tocsr()
+    matrix.sum_duplicates()
+    return matrix
+
+
+def sparse_column_normalize(matrix):
+    """Divides stored values of the sparse matrix by sums of their columns
+
+    :param matrix: sparse matrix
+    :return: matrix of the same sparsity structure
+    :rtype: scipy.sparse.csr_matrix
+    """
+    matrix = matrix.tocsr(copy=True)
+    sums = np.asarray(matrix.sum(axis=0)).ravel()
+    matrix.data = matrix.data / sums[matrix.indices]
+    return matrix
+
+
+def transition_probabilities(counts):
+    """Divides transition counts by the numbers of transitions from every cell (columns sums).
+Columns without transitions stay zero.
+
+    :param counts: transition matrix, dense or sparse
+    :return: transition probabilities of the same type
+    :rtype: numpy.ndarray or scipy.sparse.csr_matrix
+    """
+    if sparse.issparse(counts):
+        return sparse_column_normalize(counts)
+    sums = np.sum(counts, axis=0)
+    return np.divide(counts, sums, out=np.zeros_like(counts), where=sums != 0)
+
+
+def transition_log_probabilities(probabilities, fill):
+    """Takes logarithms of transition probabilities, zero probabilities get 'fill' value.
+Sparse matrices keep their structure, so their missing elements stand for 'fill'.
+
+    :param probabilities: transition probabilities, dense or sparse
+    :param fill: log-probability of transitions which never happened
+    :return: transition log-probabilities of the same type
+    :rtype: numpy.ndarray or scipy.sparse.csr_matrix
+    """
+    if sparse.issparse(probabilities):
+        matrix = probabilities.copy()
+        matrix.data = np.log(matrix.data)
+        return matrix
+    return np.log(probabilities, out=np.full_like(probabilities, fill), where=probabilities != 0)
+
+
+def transition_entropy(probabilities, log_probabilities):
+    """Calculates entropy of transitions of the matrices given by transition_probabilities
+and transition_log_probabilities"""
+    if sparse.issparse(probabilities):
+        # Both matrices keep the structure of the counts, missing transitions add nothing
+        return -np.sum(probabilities.data * log_probabilities.data)
+    return -np.sum(probabilities * log_probabilities)
+
+
+def nested_cells(grid, coarse):
+    """Finds cells of the coarse grid containing the cells of the fine grid, if the grids nest.
+Cells are numbered as in aoi_indices, the outside cell of the fine grid goes to the outside cell of the coarse one.
+
+    :param grid: cells of the fine grid for x and y coordinates
+    :param coarse: cells of the coarse grid for x and y coordinates
+    :return: coarse cell numbers of grid[0] * grid[1] + 1 fine cells, None if the coarse grid lines are not
+    the lines of the fine grid
+    :rtype: numpy.ndarray or None
+    """
+    (gx, gy), (cx, cy) = grid, coarse
+    if gx % cx or gy % cy:
+        return None
+    cells = np.arange(gx * gy)
+    mapping = (cells // gx) // (gy // cy) * cx + (cells % gx) // (gx // cx)
+    return np.append(mapping, cx * cy)
+
+
+def aggregate_transitions(counts, mapping, cells):
+    """Sums transition counts of fine cells into the counts of cells they belong to
+
+    :param counts: transition matrix of fine cells, dense or sparse
+    :param mapping: numbers of coarse cells of the fine cells, e.g. given by nested_cells
+    :param cells: total number of coarse cells
+    :return: transition matrix of (cells, cells) shape of the same type as counts
+    :rtype: numpy.ndarray or scipy.sparse.csr_matrix
+    """
+    if sparse.issparse(counts):
+        coo = counts.tocoo()
+        matrix = sparse.coo_matrix((coo.data, (mapping[coo.row], mapping[coo.col])), shape=(cells, cells)).tocsr()
+        matrix.sum_duplicates()
+        return matrix
+    to_, from_ = np.nonzero(counts)
+    matrix = np.bincount(mapping[to_] * cells + mapping[from_], weights=counts[to_, from_], minlength=cells * cells)
+    return matrix.reshape(cells, cells)
+
+
+def convex_hull_areas(x, y, groups):
+    """Calculates areas of the convex hulls of points for every group at once.
+Inner points of each group are dropped in a vectorized way (Akl-Toussaint heuristic), then hulls of the remaining
+points are built by Andrew's monotone chain and their areas are found by the shoelace formula.
+Groups with less than three points get nan area. No global state is used, so it is safe to call from threads.
+
+    :param x: x-coordinates of the points
+    :param y: y-coordinates of the points
+    :param groups: group ids of the points
+    :return: hull areas ordered as numpy.unique(groups)
+    :rtype: numpy.ndarray
+    """
+    x, y, groups = np.asarray(x, float), np.asarray(y, float), np.asarray(groups)
+    uniq, codes = np.unique(groups, return_inverse=True)
+    areas = np.full(len(uniq), np.nan)
+
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y, codes = x[finite], y[finite], codes[finite]
+    if len(codes) == 0:
+        return areas
+
+    # Extreme points of each group: leftmost, bottom, rightmost and top
+    by_x = np.lexsort((y, x, codes))
+    by_y = np.lexsort((x, y, codes))
+    starts = np.flatnonzero(np.concatenate([[True], codes[by_x][1:] != codes[by_x][:-1]]))
+    ends = np.append(starts[1:], len(codes)) - 1
+    present = codes[by_x][starts]
+    quad = np.empty((len(uniq), 4), int)
+    quad[present] = np.stack([by_x[starts], by_y[starts], by_x[ends], by_y[ends]], 1)
+
+    # Points strictly inside the quadrilateral can not be hull vertices
+    inside = np.ones(len(codes), bool)
+    for a, b in [(0, 1), (1, 2), (2, 3), (3, 0)]:
+        ia, ib = quad[codes, a], quad[codes, b]
+        inside &= (x[ib] - x[ia]) * (y - y[ia]) - (y[ib] - y[ia]) * (x - x[ia]) > 0
+
+    order = by_x[~inside[by_x]]
+    xs, ys, cs = x[order], y[order], codes[order]
+    counts = np.bincount(codes, minlength=len(uniq))
+    bounds = np.flatnonzero(np.concatenate([[True], cs[1:] != cs[:-1], [True]]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if counts[cs[start]] < 3:
+            continue
+        hull = monotone_chain(list(zip(xs[start:end].tolist(), ys[start:end].tolist())))
+        hx, hy = np.array(hull).reshape(-1, 2).T
+        areas[cs[start]] = np.abs(np.dot(hx, np.roll(hy, -1)) - np.dot(hy, np.roll(hx, -1))) / 2
+    return areas
+
+
+def monotone_chain(points):
+    """Returns the vertices of convex hull of the input points in counterclockwise order.
+The input 'points' is a list of (x,y) coordinates sorted by x and then by y."""
+    if len(points) < 3:
+        return points
+    lower, upper = [], []
+    for p in points:
+        while len(lower) > 1 and det(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) > 1 and det(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
 def polar_angle(p0,p1=None):
     """Returns the polar angle (radians) from p0 to p1.
 If p1 is None, defaults to replacing it with the global variable 'anchor', normally set in the 'graham_scan'."""
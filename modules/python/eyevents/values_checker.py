@@ -4,6 +4,13 @@ from eyevents.settings import settings as template
 
 
 class ValuesChecker:
+    # Detection methods and their necessary parameters
+    OCULUS_METHODS = dict(
+        IVT=['velocity_threshold'],
+        IDT=['dispersion_threshold', 'duration_threshold'],
+        ANH=[],
+    )
+
     @staticmethod
     def check_settings(settings):
         # Type checking
@@ -52,10 +59,11 @@ class ValuesChecker:
         if settings['velocity']['velocity_type'] == 'analytical' and 'window' not in settings['velocity'].keys():
             raise ValueError(messages['SETTINGS_VELOCITY_WINDOW_ERROR'][LANG])
         # -oculus
-        cond_keys = any([x not in settings['oculus'].keys() for x in ['method', 'velocity_threshold']])
-        if cond_keys:
-            raise ValueError(messages['SETTINGS_OCULUS_ERROR'][LANG])
-        cond_meth = settings['oculus']['method'] != 'IVT'
+        cond_meth = settings['oculus'].get('method') not in ValuesChecker.OCULUS_METHODS
         if cond_meth:
             raise ValueError(messages['SETTINGS_OCULUS_ERROR'][LANG])
+        method_keys = ValuesChecker.OCULUS_METHODS[settings['oculus']['method']]
+        cond_keys = any([x not in settings['oculus'].keys() for x in method_keys])
+        if cond_keys:
+            raise ValueError(messages['SETTINGS_OCULUS_ERROR'][LANG])
         return True
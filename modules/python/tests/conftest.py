@@ -0,0 +1,27 @@
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+DEBUG_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'debug', 'debug_files')
+
+
+@pytest.fixture
+def debug_directory():
+    return os.path.join(DEBUG_DIRECTORY, '')
+
+
+@pytest.fixture
+def debug_files(debug_directory):
+    return sorted(os.path.join(debug_directory, x) for x in os.listdir(debug_directory))
+
+
+@pytest.fixture
+def settings():
+    from eyevents.settings import settings
+    result = copy.deepcopy(settings)
+    result['columns'] = dict(time=0, porx=1, pory=2)
+    return result
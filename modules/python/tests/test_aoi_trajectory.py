@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from AOI.Trajectory import Trajectory
+
+
+def prepared(path, **parameters):
+    trajectory = Trajectory(path)
+    trajectory.set_parameters(**parameters)
+    trajectory.prepare_time()
+    trajectory.group_by_time()
+    trajectory.prepare_coordinates()
+    return trajectory
+
+
+@pytest.mark.parametrize('to_probabilities', [True, False])
+def test_reparametrised_trajectory_equals_new_one(debug_files, to_probabilities):
+    trajectory = prepared(debug_files[0], cells_x=5, cells_y=5)
+    trajectory.get_transition_matrix(to_probabilities=to_probabilities)
+    assert trajectory.transition_matrix.shape == (26, 26)
+
+    trajectory.set_parameters(cells_x=3, cells_y=3)
+    trajectory.prepare_time()
+    trajectory.group_by_time()
+    trajectory.prepare_coordinates()
+    trajectory.get_transition_matrix(to_probabilities=to_probabilities)
+
+    expected = prepared(debug_files[0], cells_x=3, cells_y=3)
+    expected.get_transition_matrix(to_probabilities=to_probabilities)
+    assert trajectory.transition_matrix.shape == (10, 10)
+    np.testing.assert_array_equal(trajectory.transition_matrix, expected.transition_matrix)
+    np.testing.assert_array_equal(trajectory.grouped_data.values, expected.grouped_data.values)
+
+
+def test_set_parameters_resets_results(debug_files):
+    trajectory = prepared(debug_files[0])
+    trajectory.get_transition_matrix()
+    trajectory.set_parameters(cells_x=3, cells_y=3)
+    assert trajectory.aoi_df is None
+    assert trajectory.grouped_data is None
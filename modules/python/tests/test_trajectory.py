@@ -0,0 +1,75 @@
+import copy
+import warnings
+
+import numpy as np
+import pytest
+
+import eyevents.trajectory
+from eyevents.trajectories import Trajectories
+from eyevents.trajectory import Trajectory
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Counts parsed recordings"""
+    counter = dict(value=0)
+    read_recording = eyevents.trajectory.read_recording
+
+    def counted(*args, **kwargs):
+        counter['value'] += 1
+        return read_recording(*args, **kwargs)
+
+    monkeypatch.setattr(eyevents.trajectory, 'read_recording', counted)
+    return counter
+
+
+@pytest.fixture(autouse=True)
+def no_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_compact_trajectory_is_read_once(debug_files, settings, reads):
+    trajectory = Trajectory(debug_files[0], settings, compact=True)
+    assert 'smoothed_df' not in trajectory.memory_usage()
+    trajectory.entropy
+    trajectory.transition_count
+    trajectory.get_grid_pyramid([[3, 3], [5, 5], [15, 15]])
+    assert reads['value'] == 1
+
+
+def test_compact_pyramid_equals_regular(debug_files, settings):
+    grids = [[3, 3], [5, 5]]
+    compact = Trajectory(debug_files[0], settings, compact=True).get_grid_pyramid(grids)
+    regular = Trajectory(debug_files[0], settings).get_grid_pyramid(grids)
+    for grid in compact:
+        assert compact[grid]['entropy'] == pytest.approx(regular[grid]['entropy'])
+
+
+def test_compact_collection_is_read_once(debug_directory, debug_files, settings, reads):
+    trajectories = Trajectories(debug_directory, settings, progress=False, compact=True)
+    trajectories.get_grid_entropies([[3, 3], [5, 5]])
+    assert reads['value'] == len(debug_files)
+
+
+def test_required_columns_can_not_be_dropped(debug_files, settings):
+    with pytest.raises(ValueError):
+        Trajectory(debug_files[0], settings, compact=True, drop_columns=['porx'])
+
+
+def test_extended_trajectory_follows_settings(debug_files, settings):
+    from eyevents.extended_trajectory import ExtendedTrajectory
+    width, height = settings['common']['resolution']
+    stimulus = np.full((height, width), 1.)
+    trajectory = ExtendedTrajectory(debug_files[0], settings, stimulus=stimulus, lazy=True, compact=True,
+                                    drop_columns=Trajectory.INTERMEDIATE_COLUMNS)
+    assert np.isfinite(trajectory.informativity)
+    before = trajectory.x
+
+    changed = copy.deepcopy(settings)
+    changed['common']['resolution'] = [width // 2, height // 2]
+    trajectory.settings = changed
+    assert not np.array_equal(trajectory.x, before)
+    np.testing.assert_array_equal(trajectory.x, ExtendedTrajectory(debug_files[0], changed).x)
+    np.testing.assert_array_equal(trajectory.y, ExtendedTrajectory(debug_files[0], changed).y)